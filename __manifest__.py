@@ -1,6 +1,6 @@
 {
     'name': 'Wave-MAGASIN',
-    'version': '1.0',
+    'version': '1.1',
     'summary': 'Intégration Wave et Orange Money pour les paiements',
     'description': 'Permet de générer des liens de paiement Wave et Orange Money et de suivre les transactions.',
     'category': 'Immobilier',
@@ -16,8 +16,13 @@
     'data': [
         'security/ir.model.access.csv',
 
+        'data/ir_cron.xml',
+
         'views/wave_config_views.xml',
         'views/wave_transaction_views.xml',
+        'views/wave_webhook_event_views.xml',
+        'views/wave_receipt_job_views.xml',
+        'views/wave_pipeline_stage_views.xml',
         'views/wave_menu.xml',
         
         # 'views/sale_order_view.xml',
@@ -0,0 +1,83 @@
+"""
+Comparaison des moteurs de rendu des factures Wave, à exécuter dans un shell Odoo:
+
+    odoo-bin shell -c odoo.conf -d <base> < benchmarks/bench_receipt_engines.py
+
+Variables d'environnement:
+    BENCH_COUNT   nombre de transactions rendues (défaut: 20)
+
+Mesure, sur les mêmes transactions complétées:
+    wkhtmltopdf        un appel wkhtmltopdf par facture (_html_to_pdf)
+    wkhtmltopdf_batch  un seul appel pour toutes les factures (_html_to_pdf_batch)
+    native             rendu reportlab dans le processus (_render_receipt_pdf_native)
+
+et imprime en JSON les durées par facture (ms): moyenne, p50, p95, ainsi que la
+taille moyenne des PDF. Rien n'est enregistré en base.
+"""
+import json
+import math
+import os
+import time
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, math.ceil(pct / 100.0 * len(values)) - 1))
+    return values[index]
+
+
+def summary(durations, sizes):
+    return {
+        'count': len(durations),
+        'mean_ms': sum(durations) / len(durations) if durations else None,
+        'p50_ms': percentile(durations, 50),
+        'p95_ms': percentile(durations, 95),
+        'mean_size_bytes': sum(sizes) / len(sizes) if sizes else None,
+    }
+
+
+def bench(env, count):
+    transactions = env['wave.transaction'].search([('status', '=', 'completed')], limit=count)
+    if not transactions:
+        transactions = env['wave.transaction'].search([], limit=count)
+    if not transactions:
+        raise SystemExit("Aucune transaction Wave à rendre")
+
+    results = {}
+
+    durations, sizes = [], []
+    for transaction in transactions:
+        start = time.perf_counter()
+        pdf = transaction._html_to_pdf(transaction._get_invoice_html_content())
+        durations.append((time.perf_counter() - start) * 1000.0)
+        sizes.append(len(pdf or b''))
+    results['wkhtmltopdf'] = summary(durations, sizes)
+
+    start = time.perf_counter()
+    pdfs = transactions._html_to_pdf_batch()
+    elapsed = (time.perf_counter() - start) * 1000.0
+    sizes = [len(pdf or b'') for pdf in pdfs.values()]
+    results['wkhtmltopdf_batch'] = dict(
+        summary([elapsed / len(transactions)] * len(transactions), sizes), total_ms=elapsed
+    )
+
+    # Premier appel hors mesure: lecture du logo, chargement de reportlab
+    transactions[0]._render_receipt_pdf_native()
+    durations, sizes = [], []
+    for transaction in transactions:
+        start = time.perf_counter()
+        pdf = transaction._render_receipt_pdf_native()
+        durations.append((time.perf_counter() - start) * 1000.0)
+        sizes.append(len(pdf or b''))
+    results['native'] = summary(durations, sizes)
+
+    return {'transactions': len(transactions), 'engines': results}
+
+
+env = globals().get('env')
+if env is None:
+    raise SystemExit("À exécuter dans un shell Odoo (odoo-bin shell)")
+print(json.dumps(bench(env, int(os.environ.get('BENCH_COUNT', 20))), indent=2))
+env.cr.rollback()
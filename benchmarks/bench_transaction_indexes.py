@@ -0,0 +1,154 @@
+"""
+Plans d'exécution des requêtes fréquentes sur wave.transaction, à exécuter dans
+un shell Odoo:
+
+    odoo-bin shell -c odoo.conf -d <base> < benchmarks/bench_transaction_indexes.py
+
+Variables d'environnement:
+    BENCH_ROWS   nombre de transactions générées (défaut: 1000000)
+
+Une table temporaire reprenant les colonnes utiles de wave_transaction est
+remplie de BENCH_ROWS lignes (85 % complétées, 5 % en attente, sur un an, trois
+transactions par facture en moyenne), puis chaque requête est expliquée
+(EXPLAIN ANALYZE) avec:
+    before  les index simples d'origine (wave_id, transaction_id, reference, status)
+    after   les index déclarés par le module (uniques, composites et partiel)
+
+Le résultat JSON donne, par requête: durée d'exécution (ms), blocs lus, nœuds et
+index utilisés. Rien n'est enregistré en base.
+"""
+import json
+import os
+
+TABLE = 'wave_transaction_bench'
+
+INDEXES = {
+    'before': [
+        f"CREATE UNIQUE INDEX ON {TABLE} (transaction_id)",
+        f"CREATE UNIQUE INDEX ON {TABLE} (reference)",
+        f"CREATE INDEX ON {TABLE} (wave_id)",
+        f"CREATE INDEX ON {TABLE} (status)",
+    ],
+    'after': [
+        f"CREATE UNIQUE INDEX ON {TABLE} (transaction_id)",
+        f"CREATE UNIQUE INDEX ON {TABLE} (reference)",
+        f"CREATE UNIQUE INDEX ON {TABLE} (wave_id)",
+        f"CREATE INDEX ON {TABLE} (status)",
+        f"CREATE INDEX ON {TABLE} (created_at)",
+        f"CREATE INDEX ON {TABLE} (account_move_id, status)",
+        f"CREATE INDEX ON {TABLE} (status, created_at DESC)",
+        f"CREATE INDEX ON {TABLE} (created_at) WHERE status = 'pending'",
+    ],
+}
+
+QUERIES = {
+    # Webhook: transaction de la session Wave
+    'webhook_wave_id': f"SELECT id FROM {TABLE} WHERE wave_id = %(wave_id)s LIMIT 1",
+    # Statut: transaction par identifiant Odoo
+    'status_transaction_id': f"SELECT id, status FROM {TABLE} WHERE transaction_id = %(transaction_id)s LIMIT 1",
+    # Statistiques des factures (read_group par facture et statut)
+    'invoice_stats': f"""SELECT account_move_id, status, count(*), sum(amount) FROM {TABLE}
+             WHERE account_move_id = ANY(%(move_ids)s)
+             GROUP BY account_move_id, status""",
+    # Filtre « Aujourd'hui », ordre par défaut de la liste
+    'list_today': f"""SELECT id FROM {TABLE} WHERE created_at >= date_trunc('day', now())
+             ORDER BY created_at DESC LIMIT 80""",
+    # Filtre par statut sur « Cette semaine »
+    'list_status_week': f"""SELECT id FROM {TABLE} WHERE status = 'completed' AND created_at >= now() - interval '7 days'
+             ORDER BY created_at DESC LIMIT 80""",
+    # Nombre de transactions par statut sur la semaine (regroupement)
+    'group_status_week': f"""SELECT status, count(*) FROM {TABLE} WHERE created_at >= now() - interval '7 days'
+             GROUP BY status""",
+    # Balayage des transactions en attente anciennes
+    'pending_sweep': f"""SELECT id FROM {TABLE} WHERE status = 'pending' AND created_at < now() - interval '1 hour'
+             ORDER BY created_at LIMIT 100""",
+}
+
+
+def create_table(cr, rows):
+    cr.execute(f"""
+        CREATE TEMP TABLE {TABLE} (
+            id serial PRIMARY KEY,
+            wave_id varchar NOT NULL,
+            transaction_id varchar NOT NULL,
+            reference varchar NOT NULL,
+            status varchar NOT NULL,
+            amount numeric,
+            account_move_id integer,
+            created_at timestamp NOT NULL
+        ) ON COMMIT DROP
+    """)
+    cr.execute(f"""
+        INSERT INTO {TABLE} (wave_id, transaction_id, reference, status, amount, account_move_id, created_at)
+        SELECT 'cos-' || i, 'TXN-' || i, 'REF-' || i,
+               CASE WHEN r < 0.85 THEN 'completed'
+                    WHEN r < 0.90 THEN 'pending'
+                    WHEN r < 0.96 THEN 'failed'
+                    WHEN r < 0.98 THEN 'cancelled'
+                    ELSE 'expired' END,
+               round((random() * 100000)::numeric, 0),
+               1 + (random() * %(moves)s)::integer,
+               now() - random() * interval '365 days'
+          FROM (SELECT i, random() AS r FROM generate_series(1, %(rows)s) AS i) AS s
+    """, {'rows': rows, 'moves': max(rows // 3, 1)})
+
+
+def set_indexes(cr, phase):
+    cr.execute("""
+        SELECT indexname FROM pg_indexes
+         WHERE tablename = %s AND indexname != %s
+    """, (TABLE, f'{TABLE}_pkey'))
+    for (indexname,) in cr.fetchall():
+        cr.execute(f'DROP INDEX "{indexname}"')
+    for statement in INDEXES[phase]:
+        cr.execute(statement)
+    cr.execute(f"ANALYZE {TABLE}")
+
+
+def plan_nodes(plan):
+    """Nœuds du plan, en profondeur: (type, index)"""
+    nodes = [(plan['Node Type'], plan.get('Index Name'))]
+    for child in plan.get('Plans', []):
+        nodes.extend(plan_nodes(child))
+    return nodes
+
+
+def explain(cr, query, params):
+    cr.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query}", params)
+    result = cr.fetchone()[0]
+    result = json.loads(result) if isinstance(result, str) else result
+    plan = result[0]['Plan']
+    nodes = plan_nodes(plan)
+    return {
+        'execution_ms': result[0]['Execution Time'],
+        'shared_blocks': plan.get('Shared Hit Blocks', 0) + plan.get('Shared Read Blocks', 0),
+        'nodes': [node for node, _index in nodes],
+        'indexes': sorted({index for _node, index in nodes if index}),
+    }
+
+
+def bench(env, rows):
+    cr = env.cr
+    create_table(cr, rows)
+    cr.execute(f"SELECT wave_id, transaction_id, account_move_id FROM {TABLE} WHERE id = %s", (rows // 2,))
+    wave_id, transaction_id, move_id = cr.fetchone()
+    params = {
+        'wave_id': wave_id,
+        'transaction_id': transaction_id,
+        'move_ids': [move_id + offset for offset in range(80)],
+    }
+
+    results = {}
+    for phase in ('before', 'after'):
+        set_indexes(cr, phase)
+        results[phase] = {name: explain(cr, query, params) for name, query in QUERIES.items()}
+    return {'rows': rows, 'queries': {
+        name: {phase: results[phase][name] for phase in results} for name in QUERIES
+    }}
+
+
+env = globals().get('env')
+if env is None:
+    raise SystemExit("À exécuter dans un shell Odoo (odoo-bin shell)")
+print(json.dumps(bench(env, int(os.environ.get('BENCH_ROWS', 1000000))), indent=2))
+env.cr.rollback()
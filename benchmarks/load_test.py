@@ -0,0 +1,185 @@
+"""
+Générateur de charge pour les endpoints de paiement Wave d'Odoo.
+
+Pilote un mélange pondéré de:
+    initiate  POST /api/payment/wave/initiate
+    status    GET  /api/payment/wave/status/<transaction_id>
+    webhook   POST /wave/webhook
+
+et imprime en JSON, par endpoint et au total: nombre d'appels, erreurs,
+latences p50/p95/p99 (ms) et débit (requêtes/s).
+
+À utiliser avec le simulateur (benchmarks/wave_simulator.py) configuré comme
+URL de l'API Wave, afin de ne jamais solliciter l'API Wave de production:
+
+    python benchmarks/load_test.py --odoo-url http://127.0.0.1:8069 \\
+        --facture-id 42 --partner-id 7 --duration 60 --concurrency 20 \\
+        --mix initiate=1,status=8,webhook=1 > bench_output.json
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, math.ceil(pct / 100.0 * len(values)) - 1))
+    return values[index]
+
+
+def parse_mix(mix):
+    weights = {}
+    for item in mix.split(','):
+        name, _, weight = item.partition('=')
+        weights[name.strip()] = float(weight or 1)
+    unknown = set(weights) - {'initiate', 'status', 'webhook'}
+    if unknown:
+        raise ValueError(f"Endpoints inconnus dans --mix: {', '.join(sorted(unknown))}")
+    return weights
+
+
+class LoadTest:
+
+    def __init__(self, args):
+        self.args = args
+        self.odoo_url = args.odoo_url.rstrip('/')
+        self.weights = parse_mix(args.mix)
+        self.lock = threading.Lock()
+        self.results = {name: {'latencies': [], 'errors': 0} for name in self.weights}
+        # Transactions créées: (transaction_id, wave_id)
+        self.transactions = []
+
+    def _call(self, method, path, payload=None):
+        data = json.dumps(payload).encode('utf-8') if payload is not None else None
+        req = urllib.request.Request(
+            f"{self.odoo_url}{path}", data=data, method=method, headers={'Content-Type': 'application/json'}
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=self.args.timeout) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    def do_initiate(self):
+        transaction_id = f"LOAD-{uuid.uuid4().hex[:16]}"
+        status, body = self._call('POST', '/api/payment/wave/initiate', {
+            'transaction_id': transaction_id,
+            'facture_id': self.args.facture_id,
+            'partner_id': self.args.partner_id,
+            'phoneNumber': '770000000',
+            'amount': random.choice([100, 500, 1000, 5000]),
+            'currency': 'XOF',
+            'reference': transaction_id,
+            'description': 'Test de charge',
+        })
+        if status == 200:
+            data = json.loads(body)
+            with self.lock:
+                self.transactions.append((transaction_id, data.get('wave_id')))
+        return status
+
+    def _pick_transaction(self):
+        with self.lock:
+            return random.choice(self.transactions) if self.transactions else None
+
+    def do_status(self):
+        transaction = self._pick_transaction()
+        if not transaction:
+            return None
+        status, _body = self._call('GET', f'/api/payment/wave/status/{transaction[0]}')
+        return status
+
+    def do_webhook(self):
+        transaction = self._pick_transaction()
+        if not transaction or not transaction[1]:
+            return None
+        status, _body = self._call('POST', '/wave/webhook', {
+            'id': f"AE_{uuid.uuid4().hex[:20]}",
+            'type': 'checkout.session.completed',
+            'data': {
+                'id': transaction[1],
+                'checkout_status': 'complete',
+                'payment_status': 'succeeded',
+                'when_completed': time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            },
+        })
+        return status
+
+    def worker(self, deadline):
+        names = list(self.weights)
+        weights = [self.weights[name] for name in names]
+        while time.monotonic() < deadline:
+            name = random.choices(names, weights)[0]
+            if name != 'initiate' and not self.transactions:
+                name = 'initiate' if 'initiate' in self.weights else name
+            start = time.monotonic()
+            try:
+                status = getattr(self, f'do_{name}')()
+            except Exception:
+                status = 0
+            if status is None:
+                continue
+            elapsed_ms = (time.monotonic() - start) * 1000.0
+            with self.lock:
+                result = self.results[name]
+                result['latencies'].append(elapsed_ms)
+                if status >= 400 or status == 0:
+                    result['errors'] += 1
+
+    def run(self):
+        start = time.monotonic()
+        deadline = start + self.args.duration
+        threads = [threading.Thread(target=self.worker, args=(deadline,)) for _ in range(self.args.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.report(time.monotonic() - start)
+
+    def report(self, elapsed):
+        def summary(latencies, errors):
+            return {
+                'count': len(latencies),
+                'errors': errors,
+                'p50_ms': percentile(latencies, 50),
+                'p95_ms': percentile(latencies, 95),
+                'p99_ms': percentile(latencies, 99),
+                'throughput_rps': len(latencies) / elapsed if elapsed else 0.0,
+            }
+
+        endpoints = {
+            name: summary(result['latencies'], result['errors']) for name, result in self.results.items()
+        }
+        all_latencies = [lat for result in self.results.values() for lat in result['latencies']]
+        return {
+            'duration_s': elapsed,
+            'concurrency': self.args.concurrency,
+            'mix': self.weights,
+            'endpoints': endpoints,
+            'total': summary(all_latencies, sum(r['errors'] for r in self.results.values())),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--odoo-url', default='http://127.0.0.1:8069')
+    parser.add_argument('--facture-id', type=int, required=True, help="ID d'une facture (account.move) existante")
+    parser.add_argument('--partner-id', type=int, required=True, help="ID d'un partenaire existant")
+    parser.add_argument('--duration', type=float, default=30.0, help="Durée du test (s)")
+    parser.add_argument('--concurrency', type=int, default=10, help="Nombre de clients simultanés")
+    parser.add_argument('--mix', default='initiate=1,status=8,webhook=1', help="Pondération des endpoints")
+    parser.add_argument('--timeout', type=float, default=60.0, help="Timeout HTTP par requête (s)")
+    args = parser.parse_args()
+    print(json.dumps(LoadTest(args).run(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
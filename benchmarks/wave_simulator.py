@@ -0,0 +1,219 @@
+"""
+Simulateur local de l'API Wave (checkout sessions) pour les tests de charge.
+
+Implémente:
+    POST /v1/checkout/sessions                  création de session
+    GET  /v1/checkout/sessions/<id>             consultation de session
+    GET  /v1/checkout/sessions?client_reference= recherche de sessions
+    POST /v1/checkout/sessions/<id>/refund      remboursement
+
+Chaque session est complétée après --completion-delay secondes, puis un webhook
+checkout.session.completed est envoyé à --webhook-url (/wave/webhook d'Odoo).
+
+Utilisation:
+    python benchmarks/wave_simulator.py --port 8765 \\
+        --webhook-url http://127.0.0.1:8069/wave/webhook \\
+        --latency-ms 80 --jitter-ms 40 --error-rate 0.01 --completion-delay 5
+
+Puis renseigner http://127.0.0.1:8765/v1 dans "URL de l'API Wave" de la
+configuration Wave (environnement sandbox).
+"""
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+import urllib.request
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+_logger = logging.getLogger('wave_simulator')
+
+SESSIONS_PATH = '/v1/checkout/sessions'
+
+
+def _now_iso():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class WaveSimulator:
+    """État et comportement du simulateur"""
+
+    def __init__(self, webhook_url=None, latency_ms=0, jitter_ms=0, error_rate=0.0,
+                 completion_delay=5.0, failure_rate=0.0):
+        self.webhook_url = webhook_url
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.completion_delay = completion_delay
+        self.failure_rate = failure_rate
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def sleep_latency(self):
+        delay = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+
+    def should_fail(self):
+        return random.random() < self.error_rate
+
+    def create_session(self, payload):
+        session_id = f"cos-{uuid.uuid4().hex[:20]}"
+        session = {
+            'id': session_id,
+            'amount': str(payload.get('amount')),
+            'currency': payload.get('currency', 'XOF'),
+            'checkout_status': 'open',
+            'payment_status': 'processing',
+            'client_reference': payload.get('client_reference'),
+            'success_url': payload.get('success_url'),
+            'error_url': payload.get('error_url'),
+            'wave_launch_url': f"https://pay.wave.com/c/{session_id}",
+            'when_created': _now_iso(),
+            'when_completed': None,
+            'when_expires': None,
+        }
+        with self.lock:
+            self.sessions[session_id] = session
+        if self.completion_delay >= 0:
+            timer = threading.Timer(self.completion_delay, self.complete_session, args=(session_id,))
+            timer.daemon = True
+            timer.start()
+        return session
+
+    def complete_session(self, session_id):
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if not session or session['checkout_status'] != 'open':
+                return
+            if random.random() < self.failure_rate:
+                session.update({'checkout_status': 'expired', 'payment_status': 'cancelled'})
+                event_type = 'checkout.session.payment_failed'
+            else:
+                session.update({
+                    'checkout_status': 'complete',
+                    'payment_status': 'succeeded',
+                    'when_completed': _now_iso(),
+                })
+                event_type = 'checkout.session.completed'
+            event = {'id': f"AE_{uuid.uuid4().hex[:20]}", 'type': event_type, 'data': dict(session)}
+        self.send_webhook(event)
+
+    def send_webhook(self, event):
+        if not self.webhook_url:
+            return
+        data = json.dumps(event).encode('utf-8')
+        req = urllib.request.Request(
+            self.webhook_url, data=data, method='POST', headers={'Content-Type': 'application/json'}
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=30) as response:
+                _logger.debug("Webhook %s -> %s", event['id'], response.status)
+        except Exception as e:
+            _logger.warning("Échec d'envoi du webhook %s: %s", event['id'], e)
+
+
+def make_handler(simulator):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            _logger.debug(format, *args)
+
+        def _send(self, status, data):
+            body = json.dumps(data).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _read_json(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            if not length:
+                return {}
+            return json.loads(self.rfile.read(length).decode('utf-8'))
+
+        def _handle(self, method):
+            url = urlparse(self.path)
+            payload = self._read_json() if method == 'POST' else {}
+            simulator.sleep_latency()
+            if simulator.should_fail():
+                return self._send(500, {'code': 'internal-server-error', 'message': 'Simulated failure'})
+            if not url.path.startswith(SESSIONS_PATH):
+                return self._send(404, {'code': 'not-found'})
+
+            parts = [p for p in url.path[len(SESSIONS_PATH):].split('/') if p]
+            if method == 'POST' and not parts:
+                return self._send(201, simulator.create_session(payload))
+            if method == 'GET' and not parts:
+                query = parse_qs(url.query)
+                reference = (query.get('client_reference') or query.get('transaction_id') or [None])[0]
+                with simulator.lock:
+                    result = [s for s in simulator.sessions.values() if s['client_reference'] == reference]
+                return self._send(200, {'result': result})
+
+            with simulator.lock:
+                session = simulator.sessions.get(parts[0])
+                if session and method == 'POST' and parts[1:] == ['refund']:
+                    session['payment_status'] = 'refunded'
+                session = dict(session) if session else None
+            if not session:
+                return self._send(404, {'code': 'checkout-session-not-found'})
+            if method == 'GET' and len(parts) == 1:
+                return self._send(200, session)
+            if method == 'POST' and parts[1:] == ['refund']:
+                return self._send(200, {})
+            return self._send(404, {'code': 'not-found'})
+
+        def do_GET(self):
+            self._handle('GET')
+
+        def do_POST(self):
+            self._handle('POST')
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--webhook-url', help="URL du webhook Odoo, ex: http://127.0.0.1:8069/wave/webhook")
+    parser.add_argument('--latency-ms', type=float, default=50.0, help="Latence moyenne ajoutée à chaque appel")
+    parser.add_argument('--jitter-ms', type=float, default=20.0, help="Variation aléatoire de la latence")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Proportion d'appels répondant 500")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="Proportion de paiements échoués")
+    parser.add_argument('--completion-delay', type=float, default=5.0,
+                        help="Délai (s) avant complétion et webhook; négatif pour ne jamais compléter")
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    simulator = WaveSimulator(
+        webhook_url=args.webhook_url,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        completion_delay=args.completion_delay,
+        failure_rate=args.failure_rate,
+    )
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(simulator))
+    server.daemon_threads = True
+    _logger.info("Simulateur Wave sur http://%s:%s/v1", args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
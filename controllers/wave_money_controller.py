@@ -1,18 +1,30 @@
 
 
-from odoo import http, fields
-from odoo.http import request, Response
-import requests
+import odoo
+from odoo import http, fields, api, sql_db, SUPERUSER_ID
+from odoo.tools import config as config_tools
+from odoo.http import request, Response, content_disposition
 import hmac
 import hashlib
 import json
 import logging
+import math
+import select
+import threading
+import time
 import werkzeug
 from datetime import datetime
 import base64
 
+from ..models.wave_client import WaveCircuitOpenError
+from ..models.wave_transaction import STATUS_CHANNEL, TERMINAL_STATUSES
+
 _logger = logging.getLogger(__name__)
 
+# Chaque attente longue garde une connexion PostgreSQL: limiter leur nombre par processus
+LONGPOLL_MAX_WAITERS = 20
+_longpoll_slots = threading.BoundedSemaphore(LONGPOLL_MAX_WAITERS)
+
 class WaveMoneyController(http.Controller):
 
     @http.route('/api/payment/wave/initiate', type='http', auth='public', cors='*', methods=['POST'], csrf=False)
@@ -36,7 +48,7 @@ class WaveMoneyController(http.Controller):
                 return self._make_response({'message': "Missing required fields: transaction_id, facture_id, partner_id"}, 400)
 
             # Récupérer la configuration Wave active
-            config = request.env['wave.config'].sudo().search([('is_active', '=', True)], limit=1)
+            config = request.env['wave.config'].sudo()._get_active_config()
             if not config:
                 return {'error': 'Wave configuration not found', 'success': False}
 
@@ -49,23 +61,17 @@ class WaveMoneyController(http.Controller):
             if not partner:
                 return self._make_response({'message': "Le partner n'existe pas"}, 400)
 
-            # Vérifier si la transaction Wave existe déjà
-            existing_tx = request.env['wave.transaction'].sudo().search([('transaction_id', '=', transaction_id)], limit=1)
+            # Vérifier si la transaction Wave existe déjà (un seul appel Wave par transaction_id)
+            existing_tx = request.env['wave.transaction'].sudo()._lock_initiate(transaction_id)
             if existing_tx:
-                return self._make_response({
-                    'success': True,
-                    'transaction_id': existing_tx.transaction_id,
-                    'invoice': existing_tx.account_move_id.get_invoice_details(),
-                    'wave_id': existing_tx.wave_id,
-                    'session_id': existing_tx.wave_id,
-                    'payment_url': existing_tx.payment_link_url,
-                    'status': existing_tx.status or 'pending',
-                    'account_move_id': existing_tx.account_move_id.id,
-                    'partner_id': existing_tx.partner_id.id,
-                    'reference': existing_tx.reference,
-                    'success_url': f"https://portail.toubasandaga.sn/wave-paiement?transaction={transaction_id}",
-                    'existe': True
-                }, 200)
+                return self._make_response(dict(
+                    existing_tx,
+                    success=True,
+                    invoice=account_move.browse(existing_tx['account_move_id']).get_invoice_details(),
+                    session_id=existing_tx['wave_id'],
+                    success_url=f"https://portail.toubasandaga.sn/wave-paiement?transaction={transaction_id}",
+                    existe=True,
+                ), 200)
 
             payload = {
                 "amount": amount,
@@ -73,18 +79,8 @@ class WaveMoneyController(http.Controller):
                 "success_url": f"https://portail.toubasandaga.sn/wave-paiement?transaction={transaction_id}",
                 "error_url": config.callback_url
             }
-            headers = {
-                "Authorization": f"Bearer {config.api_key}",
-                "Content-Type": "application/json",
-            }
-
             # Appel à l'API Wave checkout sessions
-            response = requests.post(
-                "https://api.wave.com/v1/checkout/sessions",
-                json=payload,
-                headers=headers,
-                timeout=30
-            )
+            response = config._get_wave_client().create_checkout_session(payload)
 
             if response.status_code in [200, 201]:
                 data = response.json()
@@ -126,6 +122,13 @@ class WaveMoneyController(http.Controller):
                 _logger.error(f"Wave API Error: {response.status_code} - {response.text}")
                 return self._make_response(response.text, 400)
 
+        except WaveCircuitOpenError as e:
+            _logger.warning(f"Wave payment initiation rejected: {str(e)}")
+            return request.make_response(
+                json.dumps({'success': False, 'error': str(e)}),
+                status=503,
+                headers={'Content-Type': 'application/json', 'Retry-After': str(int(e.retry_after) + 1)}
+            )
         except Exception as e:
             _logger.error(f"Error initiating Wave payment: {str(e)}")
             return self._make_response(str(e), 400)
@@ -137,58 +140,159 @@ class WaveMoneyController(http.Controller):
             if not transaction_id:
                 return Response(json.dumps({'error': 'Paiement wave avec cette transaction_id nexiste pas'}), status=400, mimetype='application/json')
 
-            # Rechercher la transaction selon les paramètres fournis
-            transaction = None
-            # Priorité 1: transaction_id (notre ID personnalisé)
-            if transaction_id:
-                transaction = request.env['wave.transaction'].sudo().search([('transaction_id', '=', transaction_id)], limit=1)
-                result = self._refresh_transaction_status(transaction)
-                if result:
-                    transaction_up = request.env['wave.transaction'].sudo().search([('transaction_id', '=', transaction_id)], limit=1)
-                    return self._make_response({
-                        'success': True,
-                        'transaction_id': transaction_up.transaction_id,
-                        'custom_transaction_id': transaction_up.transaction_id,
-                        'wave_id': transaction_up.wave_id,
-                        'session_id': transaction_up.wave_id,
-                        'reference': transaction_up.reference,
-                        'status': transaction_up.status,
-                        'checkout_status': transaction_up.checkout_status,
-                        'payment_status': transaction_up.payment_status,
-                        'amount': transaction_up.amount,
-                        'currency': transaction_up.currency,
-                        'phone': transaction_up.phone,
-                        'description': transaction_up.description,
-                        'payment_url': transaction_up.payment_link_url,
-                        'account_move_id': transaction_up.account_move_id.id if transaction_up.account_move_id else False,
-                        'account_move': transaction_up.account_move_id.get_invoice_details() if transaction_up.account_move_id else False,
-                        'partner_id': transaction_up.partner_id.id if transaction_up.partner_id else False,
-                        'created_at': transaction_up.created_at.isoformat() if transaction_up.created_at else None,
-                        'updated_at': transaction_up.updated_at.isoformat() if transaction_up.updated_at else None,
-                        'completed_at': transaction_up.completed_at.isoformat() if transaction_up.completed_at else None
-                    }, 200)
-
-                else:
-                    return self._make_response({
-                        'success': True,
-                        'transaction_id': transaction.transaction_id,
-                        'wave_id': transaction.wave_id,
-                        'session_id': transaction.wave_id,
-                        'payment_url': transaction.payment_link_url,
-                        'status': transaction.status or 'pending',
-                        'account_move_id': transaction.account_move_id.id,
-                        'account_move': transaction.account_move_id.get_invoice_details(),
-                        'partner_id': transaction.partner_id.id,
-                        'reference': transaction.reference,
-                        'existe': True
-                    }, 200)
-
-            return self._make_response({"error": "Transaction not found"}, 400)
+            transaction = request.env['wave.transaction'].sudo().search([('transaction_id', '=', transaction_id)], limit=1)
+            if not transaction:
+                return self._make_response({"error": "Transaction not found"}, 400)
+
+            # Les statuts terminaux sont servis depuis la base; un statut en attente
+            # n'est rafraîchi depuis Wave qu'une fois par TTL, quel que soit le nombre de clients
+            config = request.env['wave.config'].sudo()._get_active_config()
+            if config and transaction._claim_status_refresh(config.status_cache_ttl):
+                self._refresh_transaction_status(transaction, config)
+
+            return self._make_response(self._get_status_payload(transaction), 200)
 
         except Exception as e:
             _logger.error(f"Error getting Wave payment status: {str(e)}")
             return self._make_response({"error": str(e)}, 400)
 
+    @http.route('/longpolling/wave/status/<string:transaction_id>',
+                type='http', auth='public', cors='*', methods=['GET'])
+    def wait_wave_payment_status(self, transaction_id, since='pending', timeout=None, **kwargs):
+        """
+        Attendre un changement de statut (long-poll).
+        Répond dès que le statut de la transaction diffère de `since`, ou à
+        l'expiration du délai avec le statut courant. Servi par le worker gevent
+        (longpolling) d'Odoo; reçu par un worker HTTP en mode multiprocessus, il
+        répond immédiatement pour ne pas l'immobiliser.
+        """
+        try:
+            config = request.env['wave.config'].sudo()._get_active_config()
+            max_timeout = config.longpoll_timeout if config else 25
+            try:
+                timeout = float(timeout) if timeout else max_timeout
+            except ValueError:
+                timeout = max_timeout
+            # nan ou inf rendraient l'échéance impossible à atteindre
+            if not math.isfinite(timeout):
+                timeout = max_timeout
+            timeout = min(max(timeout, 0), max_timeout)
+
+            prefork_http_worker = config_tools['workers'] and not odoo.evented
+            if prefork_http_worker or not _longpoll_slots.acquire(blocking=False):
+                # Worker HTTP ou trop d'attentes en cours: répondre immédiatement avec le
+                # statut courant, sans ouvrir de connexion d'écoute; le client repassera
+                transaction = request.env['wave.transaction'].sudo().search(
+                    [('transaction_id', '=', transaction_id)], limit=1
+                )
+                if not transaction:
+                    return self._make_response({"error": "Transaction not found"}, 400)
+                return self._make_response(self._get_status_payload(transaction), 200)
+            try:
+                return self._wait_for_status_change(transaction_id, since, timeout)
+            finally:
+                _longpoll_slots.release()
+
+        except Exception as e:
+            _logger.error(f"Error waiting for Wave payment status: {str(e)}")
+            return self._make_response({"error": str(e)}, 400)
+
+    @http.route('/api/payment/wave/pipeline/<string:transaction_id>', type='http', auth='user', methods=['GET'])
+    def get_wave_pipeline_metrics(self, transaction_id, **kwargs):
+        """Durée, résultat et requêtes SQL des étapes de traitement d'une transaction"""
+        transaction = request.env['wave.transaction'].search([('transaction_id', '=', transaction_id)], limit=1)
+        if not transaction:
+            return self._make_response({"error": "Transaction not found"}, 404)
+        return self._make_response({
+            'success': True,
+            'transaction_id': transaction.transaction_id,
+            'status': transaction.status,
+            'stages': [stage._to_dict() for stage in transaction.pipeline_stage_ids.sorted('id')],
+        }, 200)
+
+    @http.route('/wave/receipt/<int:transaction_id>/<string:token>', type='http', auth='public', methods=['GET'])
+    def download_wave_receipt(self, transaction_id, token, download=None, **kwargs):
+        """Lien public de la facture d'une transaction (rendue à la première consultation si nécessaire)"""
+        transaction = request.env['wave.transaction'].sudo().browse(transaction_id).exists()
+        if not transaction or transaction.status != 'completed' or not transaction._check_receipt_access_token(token):
+            raise werkzeug.exceptions.NotFound()
+
+        pdf_content = transaction._get_receipt_pdf()
+        if not pdf_content:
+            return self._make_response({"error": "Erreur lors de la génération de la facture"}, 500)
+
+        filename = transaction._get_receipt_filename()
+        return request.make_response(pdf_content, headers=[
+            ('Content-Type', 'application/pdf'),
+            ('Content-Length', len(pdf_content)),
+            ('Content-Disposition', content_disposition(filename) if download else f'inline; filename="{filename}"'),
+        ])
+
+    def _wait_for_status_change(self, transaction_id, since, timeout):
+        """Écouter les NOTIFY de statut sur une connexion dédiée jusqu'au changement ou au délai"""
+        deadline = time.monotonic() + timeout
+        with sql_db.db_connect(request.env.cr.dbname).cursor() as cr:
+            # Écouter avant de lire le statut pour ne manquer aucune notification
+            cr.execute(f"LISTEN {STATUS_CHANNEL}")
+            cr.commit()
+            try:
+                env = api.Environment(cr, SUPERUSER_ID, {})
+                while True:
+                    env.invalidate_all()
+                    transaction = env['wave.transaction'].search([('transaction_id', '=', transaction_id)], limit=1)
+                    if not transaction:
+                        return self._make_response({"error": "Transaction not found"}, 400)
+                    remaining = deadline - time.monotonic()
+                    if transaction.status != since or transaction.status in TERMINAL_STATUSES or remaining <= 0:
+                        return self._make_response(self._get_status_payload(transaction), 200)
+                    # Terminer le snapshot courant pour voir le prochain commit
+                    cr.commit()
+
+                    conn = cr._cnx
+                    while remaining > 0:
+                        # Des notifications ont pu être lues pendant la lecture du statut ou
+                        # le commit: les traiter avant d'attendre de nouvelles données
+                        if not conn.notifies:
+                            if select.select([conn], [], [], remaining) == ([], [], []):
+                                break
+                            conn.poll()
+                        notified = any(notify.payload == transaction_id for notify in conn.notifies)
+                        conn.notifies.clear()
+                        if notified:
+                            break
+                        remaining = deadline - time.monotonic()
+            finally:
+                # La connexion retourne au pool: ne pas la laisser à l'écoute
+                cr.rollback()
+                cr.execute(f"UNLISTEN {STATUS_CHANNEL}")
+                cr._cnx.notifies.clear()
+
+    def _get_status_payload(self, transaction):
+        """Réponse JSON du statut d'une transaction"""
+        return {
+            'success': True,
+            'transaction_id': transaction.transaction_id,
+            'custom_transaction_id': transaction.transaction_id,
+            'wave_id': transaction.wave_id,
+            'session_id': transaction.wave_id,
+            'reference': transaction.reference,
+            'status': transaction.status or 'pending',
+            'checkout_status': transaction.checkout_status,
+            'payment_status': transaction.payment_status,
+            'amount': transaction.amount,
+            'currency': transaction.currency,
+            'phone': transaction.phone,
+            'description': transaction.description,
+            'payment_url': transaction.payment_link_url,
+            'account_move_id': transaction.account_move_id.id if transaction.account_move_id else False,
+            'account_move': transaction.account_move_id.get_invoice_details() if transaction.account_move_id else False,
+            'partner_id': transaction.partner_id.id if transaction.partner_id else False,
+            'created_at': transaction.created_at.isoformat() if transaction.created_at else None,
+            'updated_at': transaction.updated_at.isoformat() if transaction.updated_at else None,
+            'completed_at': transaction.completed_at.isoformat() if transaction.completed_at else None,
+            'existe': True
+        }
+
     def _map_wave_status_to_odoo(self, checkout_status, payment_status):
         """Mapper les statuts Wave vers les statuts Odoo"""
         checkout_status = checkout_status.lower()
@@ -204,11 +308,11 @@ class WaveMoneyController(http.Controller):
         else:
             return 'pending'
 
-    def _refresh_transaction_status(self, transaction):
+    def _refresh_transaction_status(self, transaction, config=None):
         """Rafraîchir le statut d'une transaction depuis l'API Wave"""
         try:
             _logger.info(f"Refreshing status for transaction {transaction.id}")
-            config = request.env['wave.config'].sudo().search([('is_active', '=', True)], limit=1)
+            config = config or request.env['wave.config'].sudo()._get_active_config()
             if not config:
                 return False
 
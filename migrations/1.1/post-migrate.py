@@ -0,0 +1,42 @@
+import logging
+
+from odoo import api, SUPERUSER_ID
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    """
+    Facture stockée dans une seule pièce jointe (facture_attachment_id):
+    rattacher à chaque transaction sa dernière pièce jointe publique, puis
+    supprimer les copies de l'ancien champ binaire facture_pdf.
+    """
+    if not version:
+        return
+
+    cr.execute("""
+        UPDATE wave_transaction t
+           SET facture_attachment_id = a.id
+          FROM (
+                SELECT DISTINCT ON (res_id) id, res_id
+                  FROM ir_attachment
+                 WHERE res_model = 'wave.transaction'
+                   AND res_field IS NULL
+                   AND res_id IS NOT NULL
+                   AND public
+                   AND mimetype = 'application/pdf'
+                 ORDER BY res_id, id DESC
+               ) a
+         WHERE a.res_id = t.id
+           AND t.facture_attachment_id IS NULL
+    """)
+    _logger.info("%s transaction(s) Wave rattachée(s) à leur pièce jointe de facture", cr.rowcount)
+
+    # Passer par l'ORM pour que les fichiers du filestore soient libérés
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    copies = env['ir.attachment'].search([
+        ('res_model', '=', 'wave.transaction'),
+        ('res_field', '=', 'facture_pdf'),
+    ])
+    _logger.info("Suppression de %s copie(s) du champ facture_pdf", len(copies))
+    copies.unlink()
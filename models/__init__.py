@@ -3,5 +3,10 @@
 
 from . import wave_config
 from . import wave_transaction
+from . import wave_webhook_event
+from . import wave_receipt_job
+from . import wave_pipeline_stage
 
-from . import account_move
\ No newline at end of file
+from . import account_move
+from . import account_journal
+from . import ir_mail_server
\ No newline at end of file
@@ -0,0 +1,26 @@
+from odoo import models, api
+
+# Champs utilisés par la recherche du journal des paiements Wave
+WAVE_JOURNAL_FIELDS = {'code', 'type', 'company_id', 'active'}
+
+
+class AccountJournal(models.Model):
+    _inherit = 'account.journal'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        journals = super().create(vals_list)
+        # Journal des paiements Wave mis en cache
+        self.env['wave.transaction'].clear_caches()
+        return journals
+
+    def write(self, vals):
+        result = super().write(vals)
+        if WAVE_JOURNAL_FIELDS.intersection(vals):
+            self.env['wave.transaction'].clear_caches()
+        return result
+
+    def unlink(self):
+        result = super().unlink()
+        self.env['wave.transaction'].clear_caches()
+        return result
@@ -2,13 +2,12 @@
 from odoo import models, fields, api
 from odoo.exceptions import ValidationError, UserError
 import logging
-import requests
 from datetime import datetime
 import json
+from collections import defaultdict
 
 _logger = logging.getLogger(__name__)
 
-WAVE_API_URL = "https://api.wave.com/v1/checkout/sessions"
 SUCCESS_URL = "https://portail.toubasandaga.sn/wave-paiement?transaction={}"
 
 class AccountMove(models.Model):
@@ -25,13 +24,13 @@ class AccountMove(models.Model):
     wave_transaction_count = fields.Integer(
         string='Nombre de transactions Wave',
         compute='_compute_wave_stats',
-        store=False
+        store=True
     )
 
     wave_total_paid = fields.Float(
         string='Total payé via Wave',
         compute='_compute_wave_stats',
-        store=False
+        store=True
     )
 
     wave_payment_status = fields.Selection([
@@ -39,7 +38,7 @@ class AccountMove(models.Model):
         ('partial', 'Paiement partiel'),
         ('full', 'Entièrement payé'),
         ('overpaid', 'Surpayé')
-    ], string='Statut paiement Wave', compute='_compute_wave_stats', store=False)
+    ], string='Statut paiement Wave', compute='_compute_wave_stats', store=True, index=True)
 
 
     has_wave_config = fields.Boolean(
@@ -48,13 +47,37 @@ class AccountMove(models.Model):
         store=False
     )
 
-    @api.depends('wave_transaction_ids', 'wave_transaction_ids.status', 'wave_transaction_ids.amount')
+    @api.depends('amount_total', 'wave_transaction_ids', 'wave_transaction_ids.status', 'wave_transaction_ids.amount')
     def _compute_wave_stats(self):
-        """Calculer les statistiques des paiements Wave"""
+        """
+        Calculer les statistiques des paiements Wave.
+        Les factures enregistrées sont traitées par une seule agrégation SQL
+        (nombre et montant par facture et statut), sans charger les transactions.
+        """
+        stats = defaultdict(lambda: {'count': 0, 'paid': 0.0})
+        stored = self.filtered(lambda m: isinstance(m.id, int))
+        if stored:
+            groups = self.env['wave.transaction'].sudo().read_group(
+                [('account_move_id', 'in', stored.ids)],
+                ['amount:sum'],
+                ['account_move_id', 'status'],
+                lazy=False,
+            )
+            for group in groups:
+                move_stats = stats[group['account_move_id'][0]]
+                move_stats['count'] += group['__count']
+                if group['status'] == 'completed':
+                    move_stats['paid'] += group['amount'] or 0.0
+
         for facture in self:
-            transactions = facture.wave_transaction_ids.filtered(lambda t: t.status == 'completed')
-            facture.wave_transaction_count = len(facture.wave_transaction_ids)
-            facture.wave_total_paid = sum(transactions.mapped('amount'))
+            if isinstance(facture.id, int):
+                facture.wave_transaction_count = stats[facture.id]['count']
+                facture.wave_total_paid = stats[facture.id]['paid']
+            else:
+                # Facture en cours d'édition (onchange): calcul en mémoire
+                transactions = facture.wave_transaction_ids.filtered(lambda t: t.status == 'completed')
+                facture.wave_transaction_count = len(facture.wave_transaction_ids)
+                facture.wave_total_paid = sum(transactions.mapped('amount'))
 
             # Déterminer le statut de paiement
             if facture.wave_total_paid == 0:
@@ -68,9 +91,9 @@ class AccountMove(models.Model):
 
     def _compute_has_wave_config(self):
         """Vérifier si une configuration Wave est disponible"""
+        has_wave_config = bool(self.env['wave.config']._get_active_config())
         for facture in self:
-            config = self.env['wave.config'].search([('is_active', '=', True)], limit=1)
-            facture.has_wave_config = bool(config)
+            facture.has_wave_config = has_wave_config
 
     def action_view_wave_transactions(self):
         """Action pour voir les transactions Wave de cette commande"""
@@ -163,7 +186,7 @@ class AccountMove(models.Model):
             }
 
             # Récupérer la configuration Wave active
-            config = self.env['wave.config'].sudo().search([('is_active', '=', True)], limit=1)
+            config = self.env['wave.config'].sudo()._get_active_config()
             if not config:
                 return {'error': 'Wave configuration not found', 'success': False}
 
@@ -176,22 +199,16 @@ class AccountMove(models.Model):
             if not partner:
                 return {'message': "Le partenaire n'existe pas", 'success': False}
 
-            # Vérifier si la transaction Wave existe déjà
-            existing_tx = self.env['wave.transaction'].sudo().search([('transaction_id', '=', transaction_id)], limit=1)
+            # Vérifier si la transaction Wave existe déjà (un seul appel Wave par transaction_id)
+            existing_tx = self.env['wave.transaction'].sudo()._lock_initiate(transaction_id)
             if existing_tx:
-                return {
-                    'success': True,
-                    'transaction_id': existing_tx.transaction_id,
-                    'wave_id': existing_tx.wave_id,
-                    'session_id': existing_tx.wave_id,
-                    'payment_url': existing_tx.payment_link_url,
-                    'status': existing_tx.status or 'pending',
-                    'account_move_id': existing_tx.account_move_id.id,
-                    'partner_id': existing_tx.partner_id.id,
-                    'reference': existing_tx.reference,
-                    'success_url': success_url,
-                    'existe': True
-                }
+                return dict(
+                    existing_tx,
+                    success=True,
+                    session_id=existing_tx['wave_id'],
+                    success_url=success_url,
+                    existe=True,
+                )
 
             payload = {
                 "amount": amount,
@@ -200,18 +217,8 @@ class AccountMove(models.Model):
                 "error_url": config.callback_url
             }
 
-            headers = {
-                "Authorization": f"Bearer {config.api_key}",
-                "Content-Type": "application/json",
-            }
-
             # Appel à l'API Wave checkout sessions
-            response = requests.post(
-                WAVE_API_URL,
-                json=payload,
-                headers=headers,
-                timeout=30
-            )
+            response = config._get_wave_client().create_checkout_session(payload)
 
             if response.status_code in [200, 201]:
                 data = response.json()
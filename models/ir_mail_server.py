@@ -0,0 +1,22 @@
+from odoo import models, api
+
+
+class IrMailServer(models.Model):
+    _inherit = 'ir.mail_server'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        servers = super().create(vals_list)
+        # Expéditeur des notifications de facture Wave mis en cache
+        self.env['wave.transaction'].clear_caches()
+        return servers
+
+    def write(self, vals):
+        result = super().write(vals)
+        self.env['wave.transaction'].clear_caches()
+        return result
+
+    def unlink(self):
+        result = super().unlink()
+        self.env['wave.transaction'].clear_caches()
+        return result
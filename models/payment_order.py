@@ -9,7 +9,6 @@ from datetime import datetime
 
 
 from odoo.http import request, Response
-import requests
 
 _logger = logging.getLogger(__name__)
 
@@ -89,7 +88,7 @@ class PaymentOrder(models.Model):
             }
 
             # Réccupérer la configuration Wave active
-            config = self.env['wave.config'].sudo().search([('is_active', '=', True)], limit=1)
+            config = self.env['wave.config'].sudo()._get_active_config()
             if not config:
                 return {'error': 'Wave configuration not found', 'success': False}
 
@@ -103,22 +102,16 @@ class PaymentOrder(models.Model):
             if not partner:
                 return {'message': "Le partenaire n'existe pas", 'success': False}
 
-            # Vérifier si la transaction Wave existe déjà
-            existing_tx = self.env['wave.transaction'].sudo().search([('transaction_id', '=', transaction_id)], limit=1)
+            # Vérifier si la transaction Wave existe déjà (un seul appel Wave par transaction_id)
+            existing_tx = self.env['wave.transaction'].sudo()._lock_initiate(transaction_id)
             if existing_tx:
-                return {
-                    'success': True,
-                    'transaction_id': existing_tx.transaction_id,
-                    'wave_id': existing_tx.wave_id,
-                    'session_id': existing_tx.wave_id,
-                    'payment_url': existing_tx.payment_link_url,
-                    'status': existing_tx.status or 'pending',
-                    'account_move_id': existing_tx.account_move_id.id,
-                    'partner_id': existing_tx.partner_id.id,
-                    'reference': existing_tx.reference,
-                    'success_url': success_url,
-                    'existe': True
-                }
+                return dict(
+                    existing_tx,
+                    success=True,
+                    session_id=existing_tx['wave_id'],
+                    success_url=success_url,
+                    existe=True,
+                )
 
             payload = {
                 "amount": amount,
@@ -127,18 +120,8 @@ class PaymentOrder(models.Model):
                 "error_url": config.callback_url
             }
 
-            headers = {
-                "Authorization": f"Bearer {config.api_key}",
-                "Content-Type": "application/json",
-            }
-
             # Appel à l'API Wave checkout sessions
-            response = requests.post(
-                "https://api.wave.com/v1/checkout/sessions",
-                json=payload,
-                headers=headers,
-                timeout=30
-            )
+            response = config._get_wave_client().create_checkout_session(payload)
 
             if response.status_code in [200, 201]:
                 data = response.json()
@@ -0,0 +1,205 @@
+import logging
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+_logger = logging.getLogger(__name__)
+
+WAVE_API_BASE_URL = "https://api.wave.com/v1"
+DEFAULT_POOL_SIZE = 10
+
+# Budgets de latence par opération (secondes), utilisés comme timeout HTTP
+DEFAULT_BUDGETS = {
+    'initiate': 10.0,
+    'session': 5.0,
+    'refund': 10.0,
+}
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30.0
+DEFAULT_SLOW_CALL_DURATION = 3.0
+
+# Un client par processus worker et par clé d'API (clé incluant le PID pour ne
+# jamais partager un pool de connexions hérité d'un fork): {clé: (client, réglages)}
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class WaveApiError(Exception):
+    """Erreur d'appel à l'API Wave"""
+
+
+class WaveCircuitOpenError(WaveApiError):
+    """L'API Wave est considérée indisponible: appel refusé sans requête réseau"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"API Wave indisponible, nouvel essai dans {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Disjoncteur autour des appels Wave.
+    Fermé: les appels passent. Ouvert après `failure_threshold` échecs ou appels
+    lents consécutifs: les appels échouent immédiatement. Après `reset_timeout`
+    secondes, un seul appel de test est autorisé (demi-ouvert); son succès referme
+    le circuit, son échec le rouvre.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_timeout=DEFAULT_RESET_TIMEOUT,
+                 slow_call_duration=DEFAULT_SLOW_CALL_DURATION):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.slow_call_duration = slow_call_duration
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Autoriser l'appel ou lever WaveCircuitOpenError"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            elapsed = time.monotonic() - self.opened_at
+            if elapsed >= self.reset_timeout:
+                # Un seul appel de test; les autres restent refusés jusqu'à son issue.
+                # Un appel de test sans issue (thread interrompu) est remplacé par un
+                # nouveau après reset_timeout
+                self.state = self.HALF_OPEN
+                self.opened_at = time.monotonic()
+                return
+            raise WaveCircuitOpenError(max(self.reset_timeout - elapsed, 0.0))
+
+    def record_success(self, duration):
+        if duration > self.slow_call_duration:
+            self.record_failure()
+            return
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    _logger.warning("Circuit Wave ouvert après %s échecs ou appels lents", self.failures)
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class WaveClient:
+    """Client HTTP Wave avec pool de connexions keep-alive et disjoncteur"""
+
+    def __init__(self, api_key, base_url=WAVE_API_BASE_URL, pool_size=DEFAULT_POOL_SIZE,
+                 budgets=None, breaker=None):
+        self.base_url = base_url.rstrip('/')
+        self.budgets = dict(DEFAULT_BUDGETS, **(budgets or {}))
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+        })
+        self.pool_size = None
+        self._mount_adapter(pool_size)
+
+    def _mount_adapter(self, pool_size):
+        """Monter un pool de `pool_size` connexions; l'ancien pool est fermé"""
+        previous = self.session.adapters.get('https://')
+        # pool_block=False: requests ne borne pas l'attente d'une connexion libre; un appel
+        # qui trouve le pool occupé ouvre une connexion supplémentaire (fermée après usage)
+        # au lieu d'attendre hors budget et hors disjoncteur
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=False)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.pool_size = pool_size
+        if previous is not None:
+            previous.close()
+
+    def configure(self, pool_size=DEFAULT_POOL_SIZE, budgets=None, failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                  reset_timeout=DEFAULT_RESET_TIMEOUT, slow_call_duration=DEFAULT_SLOW_CALL_DURATION):
+        """
+        Appliquer les réglages de la configuration sans recréer le client: la
+        session et l'état du disjoncteur (circuit ouvert compris) sont conservés.
+        """
+        self.budgets = dict(DEFAULT_BUDGETS, **(budgets or {}))
+        with self.breaker._lock:
+            self.breaker.failure_threshold = failure_threshold
+            self.breaker.reset_timeout = reset_timeout
+            self.breaker.slow_call_duration = slow_call_duration
+        if pool_size != self.pool_size:
+            _logger.info("Pool de connexions Wave redimensionné à %s connexions", pool_size)
+            self._mount_adapter(pool_size)
+
+    def _url(self, path):
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def _request(self, operation, method, path, timeout=None, **kwargs):
+        """Exécuter un appel sous le disjoncteur avec le budget de l'opération"""
+        self.breaker.before_call()
+        start = time.monotonic()
+        try:
+            response = self.session.request(
+                method, self._url(path), timeout=timeout or self.budgets[operation], **kwargs
+            )
+        except BaseException:
+            # Toute issue autre qu'une réponse est un échec, sinon un appel de test
+            # resterait sans issue et le circuit demi-ouvert bloquerait tous les appels
+            self.breaker.record_failure()
+            raise
+        # Les erreurs 5xx et 429 signalent une dégradation de Wave, pas les 4xx
+        if response.status_code >= 500 or response.status_code == 429:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success(time.monotonic() - start)
+        return response
+
+    def create_checkout_session(self, payload, timeout=None):
+        """Créer une session de paiement"""
+        return self._request('initiate', 'POST', 'checkout/sessions', timeout=timeout, json=payload)
+
+    def get_checkout_session(self, session_id, timeout=None):
+        """Récupérer une session de paiement par son ID"""
+        return self._request('session', 'GET', f'checkout/sessions/{session_id}', timeout=timeout)
+
+    def search_checkout_sessions(self, transaction_id, timeout=None):
+        """Récupérer les sessions de paiement d'un ID de transaction"""
+        return self._request(
+            'session', 'GET', 'checkout/sessions', timeout=timeout, params={'transaction_id': transaction_id}
+        )
+
+    def refund_checkout_session(self, session_id, timeout=None):
+        """Rembourser une session de paiement"""
+        return self._request('refund', 'POST', f'checkout/sessions/{session_id}/refund', timeout=timeout)
+
+
+def get_wave_client(api_key, base_url=WAVE_API_BASE_URL, pool_size=DEFAULT_POOL_SIZE, budgets=None,
+                    failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_timeout=DEFAULT_RESET_TIMEOUT,
+                    slow_call_duration=DEFAULT_SLOW_CALL_DURATION):
+    """
+    Retourner le client Wave partagé du processus courant pour cette clé d'API.
+    Les réglages (pool, budgets, disjoncteur) sont appliqués au client existant.
+    """
+    key = (os.getpid(), api_key, base_url)
+    settings = (pool_size, tuple(sorted(dict(DEFAULT_BUDGETS, **(budgets or {})).items())),
+                failure_threshold, reset_timeout, slow_call_duration)
+    entry = _clients.get(key)
+    if entry is None or entry[1] != settings:
+        with _clients_lock:
+            entry = _clients.get(key)
+            if entry is None:
+                _logger.info("Création d'un client Wave (pool de %s connexions)", pool_size)
+                breaker = CircuitBreaker(failure_threshold, reset_timeout, slow_call_duration)
+                entry = _clients[key] = (WaveClient(api_key, base_url, pool_size, budgets, breaker), settings)
+            elif entry[1] != settings:
+                entry[0].configure(pool_size, budgets, failure_threshold, reset_timeout, slow_call_duration)
+                entry = _clients[key] = (entry[0], settings)
+    return entry[0]
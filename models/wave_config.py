@@ -1,7 +1,22 @@
 
-from odoo import models, fields, api
+import base64
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from odoo import models, fields, api, tools
 from odoo.exceptions import ValidationError
 
+from .wave_client import (
+    get_wave_client, WaveCircuitOpenError, WAVE_API_BASE_URL, DEFAULT_POOL_SIZE, DEFAULT_BUDGETS,
+    DEFAULT_FAILURE_THRESHOLD, DEFAULT_RESET_TIMEOUT, DEFAULT_SLOW_CALL_DURATION,
+)
+from .wave_receipt_template import RECEIPT_LOGO_URL, fetch_logo
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_HISTORY_RETENTION_DAYS = 30
+
 class WaveConfig(models.Model):
     _name = 'wave.config'
     _description = 'Configuration Wave Money'
@@ -55,6 +70,14 @@ class WaveConfig(models.Model):
         ('sandbox', 'Sandbox (Test)'),
         ('production', 'Production')
     ], string='Environnement', default='sandbox', required=True)
+
+    api_base_url = fields.Char(
+        string="URL de l'API Wave",
+        required=True,
+        default=WAVE_API_BASE_URL,
+        help="URL de base de l'API Wave. En sandbox, peut pointer vers le simulateur local "
+             "(benchmarks/wave_simulator.py), par exemple http://127.0.0.1:8765/v1"
+    )
     
     default_currency = fields.Selection([
         ('XOF', 'Franc CFA (XOF)'),
@@ -62,6 +85,144 @@ class WaveConfig(models.Model):
         ('EUR', 'Euro (EUR)')
     ], string='Devise par défaut', default='XOF', required=True)
     
+    http_pool_size = fields.Integer(
+        string='Taille du pool de connexions',
+        default=DEFAULT_POOL_SIZE,
+        required=True,
+        help="Nombre maximal de connexions keep-alive vers l'API Wave par processus worker"
+    )
+
+    # Budgets de latence et disjoncteur
+    timeout_initiate = fields.Float(
+        string="Budget création de session (s)",
+        default=DEFAULT_BUDGETS['initiate'],
+        required=True,
+        help="Durée maximale d'un appel de création de session de paiement"
+    )
+
+    timeout_session = fields.Float(
+        string="Budget consultation de session (s)",
+        default=DEFAULT_BUDGETS['session'],
+        required=True,
+        help="Durée maximale d'un appel de consultation de session de paiement"
+    )
+
+    timeout_refund = fields.Float(
+        string="Budget remboursement (s)",
+        default=DEFAULT_BUDGETS['refund'],
+        required=True,
+        help="Durée maximale d'un appel de remboursement"
+    )
+
+    circuit_failure_threshold = fields.Integer(
+        string="Seuil d'ouverture du circuit",
+        default=DEFAULT_FAILURE_THRESHOLD,
+        required=True,
+        help="Nombre d'échecs ou d'appels lents consécutifs avant de suspendre les appels à Wave"
+    )
+
+    circuit_reset_timeout = fields.Float(
+        string="Durée d'ouverture du circuit (s)",
+        default=DEFAULT_RESET_TIMEOUT,
+        required=True,
+        help="Délai avant qu'un appel de test vers Wave soit de nouveau autorisé"
+    )
+
+    circuit_slow_call_duration = fields.Float(
+        string="Seuil d'appel lent (s)",
+        default=DEFAULT_SLOW_CALL_DURATION,
+        required=True,
+        help="Un appel plus long que ce seuil compte comme un échec pour le disjoncteur"
+    )
+
+    status_cache_ttl = fields.Integer(
+        string="Validité du statut en attente (s)",
+        default=10,
+        required=True,
+        help="Délai minimal entre deux interrogations de Wave pour une même transaction en attente. "
+             "Les statuts terminaux sont toujours servis depuis la base."
+    )
+
+    longpoll_timeout = fields.Integer(
+        string="Durée maximale d'attente longue (s)",
+        default=25,
+        required=True,
+        help="Durée maximale pendant laquelle l'endpoint de long-poll attend un changement de statut"
+    )
+
+    webhook_batch_size = fields.Integer(
+        string="Taille des lots de webhooks",
+        default=100,
+        required=True,
+        help="Nombre de webhooks reçus traités par lot (une validation par lot)"
+    )
+
+    receipt_worker_limit = fields.Integer(
+        string="Générations de factures simultanées",
+        default=2,
+        required=True,
+        help="Nombre maximal de factures PDF générées en parallèle par la file de tâches"
+    )
+
+    payment_journal_id = fields.Many2one(
+        'account.journal',
+        string="Journal des paiements",
+        domain="[('type', 'in', ('bank', 'cash'))]",
+        help="Journal des paiements Wave. À défaut: le journal 'CSH1' de la société, "
+             "sinon son premier journal de caisse ou de banque."
+    )
+
+    payment_method_id = fields.Many2one(
+        'account.payment.method',
+        string="Méthode de paiement",
+        domain="[('payment_type', '=', 'inbound')]",
+        help="Méthode des paiements Wave. À défaut: la première méthode de paiement entrante."
+    )
+
+    receipt_mode = fields.Selection([
+        ('eager', 'À la complétion'),
+        ('lazy', 'À la demande')
+    ], string="Génération des factures", default='eager', required=True,
+        help="À la complétion: la facture PDF est générée dès que le paiement est complété. "
+             "À la demande: seul le lien est envoyé, le PDF est rendu lors de la première consultation "
+             "et conservé dans un cache en mémoire.")
+
+    receipt_engine = fields.Selection([
+        ('wkhtmltopdf', 'wkhtmltopdf (HTML)'),
+        ('native', 'Natif (reportlab)')
+    ], string="Moteur de rendu des factures", default='wkhtmltopdf', required=True,
+        help="wkhtmltopdf: rendu du gabarit HTML par un processus externe. "
+             "Natif: la même facture dessinée directement en PDF dans le processus Odoo, "
+             "en quelques millisecondes.")
+
+    receipt_cache_size = fields.Integer(
+        string="Cache des factures (Mo)",
+        default=64,
+        required=True,
+        help="Taille maximale, par processus, du cache des factures rendues à la demande"
+    )
+
+    history_retention_days = fields.Integer(
+        string="Conservation de l'historique (jours)",
+        default=30,
+        required=True,
+        help="Durée de conservation des mesures de traitement, des webhooks traités et des "
+             "tâches de facture terminées. 0: conserver indéfiniment."
+    )
+
+    receipt_logo_url = fields.Char(
+        string="URL du logo des factures",
+        default=RECEIPT_LOGO_URL,
+        help="Logo téléchargé par une tâche planifiée quotidienne; laisser vide pour "
+             "conserver le logo chargé manuellement"
+    )
+
+    receipt_logo = fields.Binary(
+        string="Logo des factures",
+        attachment=True,
+        help="Logo imprimé sur les factures. Les gabarits sont recompilés quand il change."
+    )
+
     # Champs de suivi
     created_at = fields.Datetime(
         string='Date de création', 
@@ -94,14 +255,82 @@ class WaveConfig(models.Model):
         store=False
     )
 
+    pending_transactions = fields.Integer(
+        string='Transactions en attente',
+        compute='_compute_transaction_stats',
+        store=False
+    )
+
+    transaction_stats_html = fields.Html(
+        string='Statistiques par statut et devise',
+        compute='_compute_transaction_stats',
+        sanitize=False,
+        store=False
+    )
+
     @api.depends('is_active')
     def _compute_transaction_stats(self):
-        """Calculer les statistiques des transactions"""
+        """Calculer les statistiques des transactions (une seule agrégation SQL pour toutes les configurations)"""
+        stats = self._get_transaction_stats()
+        by_status = stats['by_status']
+        stats_html = self._get_transaction_stats_html(stats)
         for record in self:
-            transactions = self.env['wave.transaction'].search([])
-            record.total_transactions = len(transactions)
-            record.successful_transactions = len(transactions.filtered(lambda t: t.status == 'completed'))
-            record.failed_transactions = len(transactions.filtered(lambda t: t.status == 'failed'))
+            record.total_transactions = stats['total']
+            record.successful_transactions = by_status.get('completed', {}).get('count', 0)
+            record.failed_transactions = by_status.get('failed', {}).get('count', 0)
+            record.pending_transactions = by_status.get('pending', {}).get('count', 0)
+            record.transaction_stats_html = stats_html
+
+    @api.model
+    def _get_transaction_stats(self):
+        """
+        Nombre et montant des transactions par statut et par devise, calculés par
+        un unique GROUP BY en base (sans charger les transactions).
+        Returns:
+            dict: {'total', 'by_status': {statut: {'count', 'amounts': {devise: montant}}},
+                   'by_currency': {devise: {'count', 'amounts': {statut: montant}}}}
+        """
+        groups = self.env['wave.transaction'].sudo().read_group(
+            [], ['amount:sum'], ['status', 'currency'], lazy=False
+        )
+        stats = {'total': 0, 'by_status': {}, 'by_currency': {}}
+        for group in groups:
+            count = group['__count']
+            amount = group['amount'] or 0.0
+            status, currency = group['status'], group['currency']
+            stats['total'] += count
+            by_status = stats['by_status'].setdefault(status, {'count': 0, 'amounts': {}})
+            by_status['count'] += count
+            by_status['amounts'][currency] = by_status['amounts'].get(currency, 0.0) + amount
+            by_currency = stats['by_currency'].setdefault(currency, {'count': 0, 'amounts': {}})
+            by_currency['count'] += count
+            by_currency['amounts'][status] = by_currency['amounts'].get(status, 0.0) + amount
+        return stats
+
+    @api.model
+    def _get_transaction_stats_html(self, stats):
+        """Tableau des statistiques: une ligne par statut, une colonne par devise"""
+        if not stats['total']:
+            return "<p>Aucune transaction.</p>"
+        status_labels = dict(self.env['wave.transaction']._fields['status'].selection)
+        currencies = sorted(stats['by_currency'])
+        header = ''.join(f"<th class='text-end'>{currency}</th>" for currency in currencies)
+        rows = []
+        for status, label in status_labels.items():
+            values = stats['by_status'].get(status)
+            if not values:
+                continue
+            cells = ''.join(
+                f"<td class='text-end'>{values['amounts'].get(currency, 0.0):,.2f}</td>".replace(',', ' ')
+                for currency in currencies
+            )
+            rows.append(f"<tr><td>{label}</td><td class='text-end'>{values['count']}</td>{cells}</tr>")
+        return (
+            "<table class='table table-sm'>"
+            f"<thead><tr><th>Statut</th><th class='text-end'>Nombre</th>{header}</tr></thead>"
+            f"<tbody>{''.join(rows)}</tbody>"
+            "</table>"
+        )
 
     @api.constrains('is_active')
     def _check_single_active_config(self):
@@ -111,10 +340,128 @@ class WaveConfig(models.Model):
             if other_active:
                 raise ValidationError("Une seule configuration Wave peut être active à la fois.")
 
+    @api.constrains('http_pool_size')
+    def _check_http_pool_size(self):
+        for record in self:
+            if record.http_pool_size < 1:
+                raise ValidationError("La taille du pool de connexions doit être au moins 1.")
+
+    @api.constrains('timeout_initiate', 'timeout_session', 'timeout_refund', 'circuit_failure_threshold')
+    def _check_circuit_settings(self):
+        for record in self:
+            if min(record.timeout_initiate, record.timeout_session, record.timeout_refund) <= 0:
+                raise ValidationError("Les budgets de latence doivent être strictement positifs.")
+            if record.circuit_failure_threshold < 1:
+                raise ValidationError("Le seuil d'ouverture du circuit doit être au moins 1.")
+
+    @api.constrains('history_retention_days')
+    def _check_history_retention_days(self):
+        for record in self:
+            if record.history_retention_days < 0:
+                raise ValidationError("La durée de conservation de l'historique ne peut pas être négative.")
+
+    @api.constrains('receipt_cache_size')
+    def _check_receipt_cache_size(self):
+        for record in self:
+            if record.receipt_cache_size < 0:
+                raise ValidationError("La taille du cache des factures ne peut pas être négative.")
+
+    @api.model
+    def _get_active_config(self):
+        """Configuration active, vide si aucune (identifiant mis en cache par worker)"""
+        return self.browse(self._get_active_config_id())
+
+    @api.model
+    @tools.ormcache()
+    def _get_active_config_id(self):
+        """Identifiant de la configuration active (cache vidé à la création, l'activation ou la suppression d'une configuration)"""
+        return self.sudo().search([('is_active', '=', True)], limit=1).id
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        configs = super().create(vals_list)
+        self.clear_caches()
+        if any(config.receipt_logo_url and not config.receipt_logo for config in configs):
+            self.env.ref(f'{self._module}.ir_cron_refresh_wave_receipt_logo')._trigger()
+        return configs
+
     def write(self, vals):
         """Mettre à jour la date de modification"""
         vals['updated_at'] = fields.Datetime.now()
-        return super().write(vals)
+        result = super().write(vals)
+        if 'is_active' in vals:
+            # Les autres workers rechargent leur cache à la prochaine requête
+            self.clear_caches()
+        if vals.get('receipt_logo_url'):
+            self.env.ref(f'{self._module}.ir_cron_refresh_wave_receipt_logo')._trigger()
+        return result
+
+    def _get_receipt_logo_attachment(self):
+        """Pièce jointe du logo des factures (empreinte et contenu), vide si aucun logo"""
+        if not self:
+            return self.env['ir.attachment']
+        self.ensure_one()
+        return self.env['ir.attachment'].sudo().search([
+            ('res_model', '=', self._name),
+            ('res_id', '=', self.id),
+            ('res_field', '=', 'receipt_logo'),
+        ], limit=1)
+
+    @api.model
+    def _cron_purge_history(self):
+        """Supprimer l'historique plus ancien que la durée de conservation (tâche planifiée)"""
+        config = self._get_active_config()
+        retention_days = config.history_retention_days if config else DEFAULT_HISTORY_RETENTION_DAYS
+        if retention_days <= 0:
+            return True
+        cutoff = fields.Datetime.now() - timedelta(days=retention_days)
+        for model in ('wave.pipeline.stage', 'wave.webhook.event', 'wave.receipt.job'):
+            count = self.env[model].sudo()._purge_history(cutoff)
+            if count:
+                _logger.info("%s enregistrement(s) %s antérieurs au %s supprimé(s)", count, model, cutoff)
+        return True
+
+    @api.model
+    def _cron_refresh_receipt_logo(self):
+        """Télécharger le logo des factures et l'enregistrer s'il a changé"""
+        config = self._get_active_config()
+        if config and config.receipt_logo_url:
+            config.action_refresh_receipt_logo()
+        return True
+
+    def action_refresh_receipt_logo(self):
+        """Télécharger le logo depuis son URL; sans effet si le contenu est identique"""
+        self.ensure_one()
+        logo = fetch_logo(self.receipt_logo_url)
+        if not logo:
+            return False
+        attachment = self._get_receipt_logo_attachment()
+        if attachment.checksum != attachment._compute_checksum(logo):
+            _logger.info("Nouveau logo des factures Wave (%s octets)", len(logo))
+            self.write({'receipt_logo': base64.b64encode(logo)})
+        return True
+
+    def unlink(self):
+        result = super().unlink()
+        self.clear_caches()
+        return result
+
+    def _get_wave_client(self):
+        """Retourner le client HTTP Wave partagé pour cette configuration"""
+        self.ensure_one()
+        return get_wave_client(
+            self.api_key,
+            base_url=self.api_base_url or WAVE_API_BASE_URL,
+            pool_size=self.http_pool_size,
+            budgets={
+                'initiate': self.timeout_initiate,
+                'session': self.timeout_session,
+                'refund': self.timeout_refund,
+            },
+            failure_threshold=self.circuit_failure_threshold,
+            reset_timeout=self.circuit_reset_timeout,
+            slow_call_duration=self.circuit_slow_call_duration,
+        )
 
     def action_view_transactions(self):
         """Action pour voir toutes les transactions"""
@@ -195,13 +542,6 @@ class WaveConfig(models.Model):
     def test_connection(self):
         """Tester la connexion à l'API Wave"""
         try:
-            import requests
-
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json",
-            }
-
             # Test avec un endpoint compatible avec checkout_api
             # Créer un paiement de test minimal pour vérifier la connexion
             test_payload = {
@@ -212,12 +552,7 @@ class WaveConfig(models.Model):
             }
 
             # Utiliser l'endpoint de création de checkout sessions qui fonctionne avec checkout_api
-            response = requests.post(
-                "https://api.wave.com/v1/checkout/sessions",
-                json=test_payload,
-                headers=headers,
-                timeout=10
-            )
+            response = self._get_wave_client().create_checkout_session(test_payload)
 
             if response.status_code == 201 :
                 # Succès - supprimer le paiement de test si possible
@@ -290,68 +625,84 @@ class WaveConfig(models.Model):
     def get_session_by_id(self, session_id):
         """Récupérer une session de paiement par son ID"""
         try:
-            import requests
-
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",  
-                "Content-Type": "application/json",
-            }
-            response = requests.get(
-                f"https://api.wave.com/v1/checkout/sessions/{session_id}",
-                headers=headers,
-                timeout=10
-            )
+            response = self._get_wave_client().get_checkout_session(session_id)
 
             if response.status_code == 200:
                 return response.json()
             else:
                 return None
 
+        except WaveCircuitOpenError:
+            raise
         except Exception as e:
+            _logger.warning(f"Erreur lors de l'appel à l'API Wave: {str(e)}")
             return None
+
+    def get_sessions_by_ids(self, session_ids, max_workers=None):
+        """Récupérer plusieurs sessions de paiement en parallèle
+
+        Args:
+            session_ids: Liste des IDs de session Wave (wave_id)
+            max_workers: Nombre maximal de requêtes simultanées
+                         (par défaut la taille du pool de connexions)
+        Returns:
+            dict: {'sessions': {wave_id: données}, 'errors': {wave_id: message}}
+        """
+        self.ensure_one()
+        session_ids = list(dict.fromkeys(sid for sid in session_ids if sid))
+        result = {'sessions': {}, 'errors': {}}
+        if not session_ids:
+            return result
+
+        # Les threads n'utilisent que le client HTTP, jamais l'environnement Odoo
+        client = self._get_wave_client()
+        max_workers = min(max_workers or self.http_pool_size, self.http_pool_size, len(session_ids))
+
+        def fetch(session_id):
+            try:
+                response = client.get_checkout_session(session_id)
+                if response.status_code == 200:
+                    return session_id, response.json(), None
+                return session_id, None, f"HTTP {response.status_code}: {response.text}"
+            except Exception as e:
+                return session_id, None, str(e)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for session_id, data, error in executor.map(fetch, session_ids):
+                if error:
+                    result['errors'][session_id] = error
+                else:
+                    result['sessions'][session_id] = data
+        return result
+
     def get_seesion_by_id_transaction(self, transaction_id):
         """Récupérer une session de paiement par son ID de transaction"""
         try:
-            import requests
-
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json",
-            }
-            response = requests.get(
-                f"https://api.wave.com/v1/checkout/sessions?transaction_id={transaction_id}",
-                headers=headers,
-                timeout=10
-            )
+            response = self._get_wave_client().search_checkout_sessions(transaction_id)
 
             if response.status_code == 200:
                 return response.json()
             else:
                 return None
 
+        except WaveCircuitOpenError:
+            raise
         except Exception as e:
+            _logger.warning(f"Erreur lors de l'appel à l'API Wave: {str(e)}")
             return None
         
     def refund_transaction(self, session_id):
         """Rembourser une transaction Wave"""
         try:
-            import requests
-
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json",
-            }
-        
-            response = requests.post(
-                f"https://api.wave.com/v1/checkout/sessions/{session_id}/refund",
-                headers=headers,
-                timeout=10
-            )
+            response = self._get_wave_client().refund_checkout_session(session_id)
             if response.status_code == 200:
                 return response.json()
             else:
                 return None
 
+        except WaveCircuitOpenError:
+            raise
         except Exception as e:
+            _logger.warning(f"Erreur lors de l'appel à l'API Wave: {str(e)}")
             return None
 
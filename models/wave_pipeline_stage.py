@@ -0,0 +1,183 @@
+from odoo import models, fields, api
+import logging
+import time
+import uuid
+from collections import defaultdict
+
+_logger = logging.getLogger(__name__)
+
+PIPELINE_STAGES = [
+    ('receipt_schedule', 'Planification de la facture'),
+    ('receipt_link', 'Lien de facture à la demande'),
+    ('render', 'Rendu PDF'),
+    ('attachment', 'Pièce jointe'),
+    ('auto_save', 'Enregistrement'),
+    ('notification', 'Notification email'),
+    ('payment', 'Paiement et réconciliation'),
+]
+
+
+class WavePipelineStage(models.Model):
+    _name = 'wave.pipeline.stage'
+    _description = 'Étape de traitement d\'une transaction Wave'
+    _order = 'id desc'
+    _rec_name = 'stage'
+
+    transaction_id = fields.Many2one(
+        'wave.transaction',
+        string="Transaction",
+        required=True,
+        index=True,
+        ondelete='cascade'
+    )
+
+    pipeline = fields.Selection([
+        ('completion', 'Complétion'),
+        ('receipt', 'Facture'),
+        ('webhook', 'Webhook')
+    ], string='Traitement', required=True, index=True)
+
+    run_id = fields.Char(
+        string="Exécution",
+        index=True,
+        help="Identifiant commun aux étapes d'une même exécution"
+    )
+
+    stage = fields.Selection(PIPELINE_STAGES, string='Étape', required=True, index=True)
+
+    sequence = fields.Integer(
+        string="Ordre",
+        help="Position de l'étape dans l'exécution, pour sa transaction"
+    )
+
+    outcome = fields.Selection([
+        ('success', 'Réussie'),
+        ('skipped', 'Sans objet'),
+        ('failed', 'Échouée')
+    ], string='Résultat', required=True, index=True)
+
+    started_at = fields.Datetime(
+        string="Début"
+    )
+
+    duration_ms = fields.Float(
+        string="Durée (ms)",
+        digits=(16, 1)
+    )
+
+    sql_count = fields.Integer(
+        string="Requêtes SQL",
+        help="Nombre de requêtes SQL exécutées pendant l'étape"
+    )
+
+    batch_size = fields.Integer(
+        string="Taille du lot",
+        default=1,
+        help="Nombre de transactions traitées ensemble par l'étape (durée et requêtes partagées)"
+    )
+
+    error = fields.Text(
+        string="Erreur"
+    )
+
+    @api.model
+    def _purge_history(self, cutoff):
+        """Supprimer les mesures enregistrées avant `cutoff`; retourne le nombre supprimé"""
+        self.env.cr.execute("DELETE FROM wave_pipeline_stage WHERE create_date < %s", (cutoff,))
+        return self.env.cr.rowcount
+
+    def _to_dict(self):
+        self.ensure_one()
+        return {
+            'pipeline': self.pipeline,
+            'run_id': self.run_id,
+            'stage': self.stage,
+            'sequence': self.sequence,
+            'outcome': self.outcome,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'duration_ms': self.duration_ms,
+            'sql_count': self.sql_count,
+            'batch_size': self.batch_size,
+            'error': self.error or None,
+        }
+
+
+class CompletionPipeline:
+    """
+    Exécute les étapes de traitement de transactions Wave et mesure chacune:
+    durée, résultat et nombre de requêtes SQL. Chaque étape s'exécute dans son
+    propre savepoint; une erreur est journalisée et enregistrée au lieu d'être
+    ignorée. Les mesures sont écrites dans wave.pipeline.stage par save().
+    """
+
+    def __init__(self, transactions, pipeline):
+        self.transactions = transactions
+        self.env = transactions.env
+        self.pipeline = pipeline
+        self.run_id = uuid.uuid4().hex
+        self.records = []
+        # Rang de la dernière étape enregistrée, par transaction
+        self.sequences = defaultdict(int)
+
+    def run(self, stage, func, *args, transactions=None, required=False, **kwargs):
+        """
+        Exécuter une étape.
+        Args:
+            stage: Code de l'étape (PIPELINE_STAGES)
+            func: Fonction à exécuter avec *args et **kwargs
+            transactions: Transactions concernées (par défaut celles du traitement)
+            required: Un résultat vide est un échec (sinon False signifie « sans objet »)
+        Returns:
+            Le résultat de la fonction, None en cas d'erreur
+        """
+        transactions = self.transactions if transactions is None else transactions
+        cr = self.env.cr
+        queries = cr.sql_log_count
+        started_at = fields.Datetime.now()
+        start = time.perf_counter()
+        error = False
+        try:
+            with cr.savepoint():
+                result = func(*args, **kwargs)
+        except Exception as e:
+            _logger.exception("Étape %s échouée pour les transactions %s", stage, transactions.ids)
+            result = None
+            error = str(e)
+        duration_ms = (time.perf_counter() - start) * 1000.0
+
+        if error or (required and not result):
+            outcome = 'failed'
+            error = error or "Aucun résultat"
+        elif result is False:
+            outcome = 'skipped'
+        else:
+            outcome = 'success'
+        for transaction in transactions:
+            self.sequences[transaction.id] += 1
+            self.records.append({
+                'transaction_id': transaction.id,
+                'pipeline': self.pipeline,
+                'run_id': self.run_id,
+                'stage': stage,
+                'sequence': self.sequences[transaction.id],
+                'outcome': outcome,
+                'started_at': started_at,
+                'duration_ms': duration_ms,
+                'sql_count': cr.sql_log_count - queries,
+                'batch_size': len(transactions),
+                'error': error,
+            })
+        return result
+
+    def save(self):
+        """Enregistrer les mesures des étapes exécutées"""
+        if not self.records:
+            return self.env['wave.pipeline.stage']
+        try:
+            with self.env.cr.savepoint():
+                return self.env['wave.pipeline.stage'].sudo().create(self.records)
+        except Exception as e:
+            _logger.error(f"Erreur lors de l'enregistrement des mesures de traitement: {str(e)}")
+            return self.env['wave.pipeline.stage']
+        finally:
+            self.records = []
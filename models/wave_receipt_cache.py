@@ -0,0 +1,56 @@
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+class ReceiptCache:
+    """
+    Cache LRU en mémoire des factures PDF rendues à la demande, borné en octets.
+    Partagé par les threads du processus; chaque worker a le sien.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Retourner le contenu en cache (et le marquer récemment utilisé) ou None"""
+        with self._lock:
+            content = self._entries.get(key)
+            if content is not None:
+                self._entries.move_to_end(key)
+            return content
+
+    def put(self, key, content):
+        """Mettre en cache un contenu, en évinçant les moins récemment utilisés"""
+        if len(content) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._entries[key] = content
+            self.size += len(content)
+            self._evict()
+
+    def resize(self, max_bytes):
+        """Changer la taille maximale du cache"""
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _evict(self):
+        while self.size > self.max_bytes and self._entries:
+            _key, content = self._entries.popitem(last=False)
+            self.size -= len(content)
+
+
+receipt_cache = ReceiptCache()
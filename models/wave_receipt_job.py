@@ -0,0 +1,177 @@
+from odoo import models, fields, api
+from odoo.tools import config
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_WORKER_LIMIT = 2
+# Durée maximale d'une exécution de la tâche planifiée (secondes), bornée en plus
+# à la moitié de la limite de temps réel des crons pour ne jamais être interrompue
+RUN_TIME_LIMIT = 60
+
+
+class WaveReceiptJob(models.Model):
+    _name = 'wave.receipt.job'
+    _description = 'Génération différée de reçu Wave'
+    _order = 'priority, id'
+    _rec_name = 'transaction_id'
+
+    transaction_id = fields.Many2one(
+        'wave.transaction',
+        string="Transaction",
+        required=True,
+        index=True,
+        ondelete='cascade'
+    )
+
+    priority = fields.Integer(
+        string="Priorité",
+        default=10,
+        index=True,
+        help="Les tâches de plus petite priorité sont traitées en premier"
+    )
+
+    state = fields.Selection([
+        ('pending', 'En attente'),
+        ('done', 'Terminé'),
+        ('failed', 'Échoué')
+    ], string='État', default='pending', required=True, index=True)
+
+    attempts = fields.Integer(
+        string="Tentatives",
+        default=0
+    )
+
+    max_attempts = fields.Integer(
+        string="Tentatives maximales",
+        default=3
+    )
+
+    next_attempt_at = fields.Datetime(
+        string="Prochaine tentative",
+        help="Date à partir de laquelle la tâche peut être (re)tentée"
+    )
+
+    error = fields.Text(
+        string="Erreur"
+    )
+
+    done_at = fields.Datetime(
+        string="Date de fin",
+        readonly=True
+    )
+
+    notify = fields.Boolean(
+        string="Notifier le client",
+        default=True,
+        help="Envoyer la facture au client une fois générée (désactivé pour les régénérations)"
+    )
+
+    @api.model
+    def _enqueue(self, transactions, priority=10, notify=True):
+        """Planifier la génération du reçu des transactions données"""
+        jobs = self.create([{
+            'transaction_id': transaction.id,
+            'priority': priority,
+            'notify': notify,
+        } for transaction in transactions])
+        transactions.write({'receipt_state': 'pending'})
+        self.env.ref(f'{self._module}.ir_cron_run_wave_receipt_jobs')._trigger()
+        return jobs
+
+    @api.model
+    def _cron_run(self):
+        """Exécuter les tâches en attente avec au plus N générations simultanées"""
+        wave_config = self.env['wave.config'].sudo()._get_active_config()
+        worker_limit = max(wave_config.receipt_worker_limit if wave_config else DEFAULT_WORKER_LIMIT, 1)
+        deadline = time.monotonic() + self._get_run_time_limit()
+        if worker_limit == 1:
+            self._run_worker(deadline)
+        else:
+            # Chaque worker utilise son propre curseur et réserve ses tâches (SKIP LOCKED)
+            with ThreadPoolExecutor(max_workers=worker_limit) as executor:
+                for future in [executor.submit(self._run_worker, deadline) for _i in range(worker_limit)]:
+                    future.result()
+        # Délai atteint avec des tâches exécutables restantes: replanifier immédiatement
+        if self._has_runnable_jobs():
+            self.env.ref(f'{self._module}.ir_cron_run_wave_receipt_jobs')._trigger()
+        return True
+
+    @api.model
+    def _get_run_time_limit(self):
+        """Durée d'une exécution: RUN_TIME_LIMIT, au plus la moitié de la limite de temps réel des crons"""
+        limit = config.get('limit_time_real_cron') or -1
+        if limit < 0:
+            limit = config.get('limit_time_real') or 0
+        return min(RUN_TIME_LIMIT, limit / 2) if limit > 0 else RUN_TIME_LIMIT
+
+    @api.model
+    def _has_runnable_jobs(self):
+        """Reste-t-il des tâches exécutables maintenant ?"""
+        now = fields.Datetime.now()
+        return bool(self.search([
+            ('state', '=', 'pending'),
+            '|', ('next_attempt_at', '=', False), ('next_attempt_at', '<=', now),
+        ], limit=1))
+
+    def _run_worker(self, deadline):
+        """Traiter les tâches une à une, chacune dans sa propre transaction SQL"""
+        while time.monotonic() < deadline:
+            with self.pool.cursor() as cr:
+                job = self.with_env(self.env(cr=cr))._claim_next()
+                if not job:
+                    return
+                job._run()
+
+    @api.model
+    def _purge_history(self, cutoff):
+        """Supprimer les tâches terminées ou échouées créées avant `cutoff`"""
+        self.env.cr.execute("""
+            DELETE FROM wave_receipt_job
+             WHERE state != 'pending'
+               AND create_date < %s
+        """, (cutoff,))
+        return self.env.cr.rowcount
+
+    @api.model
+    def _claim_next(self):
+        """Réserver la prochaine tâche exécutable, ignorée par les autres workers jusqu'au commit"""
+        self.env.cr.execute("""
+            SELECT id FROM wave_receipt_job
+             WHERE state = 'pending'
+               AND (next_attempt_at IS NULL OR next_attempt_at <= %s)
+             ORDER BY priority, id
+             LIMIT 1
+               FOR UPDATE SKIP LOCKED
+        """, (fields.Datetime.now(),))
+        row = self.env.cr.fetchone()
+        return self.browse(row[0]) if row else self.browse()
+
+    def _run(self):
+        """Générer le reçu; en cas d'échec, replanifier avec un délai croissant"""
+        self.ensure_one()
+        transaction = self.transaction_id.sudo().with_context(wave_receipt_no_notify=not self.notify)
+        try:
+            with self.env.cr.savepoint():
+                url_facture = transaction._generate_invoice_pdf()
+            error = False if url_facture else "Erreur lors de la génération du PDF"
+        except Exception as e:
+            _logger.exception("Erreur lors de la génération du reçu de la transaction %s", transaction.transaction_id)
+            error = str(e)
+
+        attempts = self.attempts + 1
+        if not error:
+            self.write({'state': 'done', 'attempts': attempts, 'error': False, 'done_at': fields.Datetime.now()})
+            transaction.write({'receipt_state': 'ready'})
+        elif attempts >= self.max_attempts:
+            self.write({'state': 'failed', 'attempts': attempts, 'error': error})
+            transaction.write({'receipt_state': 'failed'})
+        else:
+            self.write({
+                'attempts': attempts,
+                'error': error,
+                'next_attempt_at': fields.Datetime.now() + timedelta(minutes=2 ** attempts),
+            })
@@ -0,0 +1,205 @@
+"""
+Moteur natif de rendu des factures Wave: dessine directement le PDF avec
+reportlab, dans le processus, sans passer par HTML ni wkhtmltopdf.
+Reprend la mise en page de `wave.transaction._get_invoice_html_content`.
+"""
+import io
+import logging
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.lib.utils import ImageReader, simpleSplit
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+
+_logger = logging.getLogger(__name__)
+
+BRAND_COLOR = colors.HexColor('#2879b9')
+SUCCESS_COLOR = colors.HexColor('#28a745')
+MUTED_COLOR = colors.HexColor('#6c757d')
+BORDER_COLOR = colors.HexColor('#dee2e6')
+BOX_COLOR = colors.HexColor('#f8f9fa')
+
+FONT = 'Helvetica'
+FONT_BOLD = 'Helvetica-Bold'
+
+PAGE_WIDTH, PAGE_HEIGHT = A4
+# Marge de page (10 mm) + marge intérieure du corps (20 px)
+MARGIN = 10 * mm + 5 * mm
+CONTENT_WIDTH = PAGE_WIDTH - 2 * MARGIN
+LOGO_MAX_WIDTH = 48 * mm
+LOGO_MAX_HEIGHT = 32 * mm
+LABEL_COLUMN_WIDTH = 45 * mm
+CELL_PADDING = 2 * mm
+
+
+def _text(value):
+    """Texte affichable avec les polices standard PDF (espaces insécables normalisés)"""
+    return str(value if value not in (None, False) else '').replace('\u202f', ' ').replace('\xa0', ' ')
+
+
+class _ReceiptCanvas:
+    """Curseur vertical au-dessus d'un canvas reportlab, avec saut de page"""
+
+    def __init__(self, buffer, title):
+        self.canvas = canvas.Canvas(buffer, pagesize=A4, pageCompression=1)
+        self.canvas.setTitle(title)
+        self.y = PAGE_HEIGHT - MARGIN
+
+    def ensure_space(self, height):
+        if self.y - height < MARGIN:
+            self.canvas.showPage()
+            self.y = PAGE_HEIGHT - MARGIN
+
+    def labelled_line(self, label, value, size=10, leading=15, value_color=colors.black, value_font=FONT):
+        """Ligne « Libellé: valeur » avec le libellé en gras"""
+        self.ensure_space(leading)
+        self.y -= leading
+        c = self.canvas
+        c.setFont(FONT_BOLD, size)
+        c.setFillColor(colors.black)
+        label = f"{label}: "
+        c.drawString(MARGIN, self.y, label)
+        c.setFont(value_font, size)
+        c.setFillColor(value_color)
+        c.drawString(MARGIN + stringWidth(label, FONT_BOLD, size), self.y, _text(value))
+        c.setFillColor(colors.black)
+
+
+def render_receipt_pdf(values, logo=None):
+    """
+    Dessiner la facture d'une transaction.
+    Args:
+        values: Valeurs de `wave.transaction._get_receipt_values()`
+        logo: Contenu de l'image du logo (optionnel)
+    Returns:
+        bytes: Contenu PDF
+    """
+    buffer = io.BytesIO()
+    page = _ReceiptCanvas(buffer, f"Facture Wave - {_text(values['reference'])}")
+    c = page.canvas
+
+    # En-tête: titre et référence à gauche, logo à droite
+    header_height = 14 * mm
+    if logo:
+        try:
+            image = ImageReader(io.BytesIO(logo))
+            width, height = image.getSize()
+            scale = min(LOGO_MAX_WIDTH / width, LOGO_MAX_HEIGHT / height, 1.0)
+            width, height = width * scale, height * scale
+            header_height = max(header_height, height)
+            c.drawImage(image, PAGE_WIDTH - MARGIN - width, page.y - header_height + (header_height - height) / 2,
+                        width=width, height=height, mask='auto')
+        except Exception as e:
+            _logger.warning("Logo de facture illisible: %s", e)
+    title_y = page.y - header_height / 2
+    c.setFillColor(BRAND_COLOR)
+    c.setFont(FONT_BOLD, 16)
+    c.drawString(MARGIN, title_y + 2 * mm, "FACTURE DE PAIEMENT")
+    c.setFillColor(colors.black)
+    c.setFont(FONT_BOLD, 12)
+    c.drawString(MARGIN, title_y - 4 * mm, f"Référence: {_text(values['reference'])}")
+    page.y -= header_height + 5 * mm
+    c.setStrokeColor(BRAND_COLOR)
+    c.setLineWidth(1.5)
+    c.line(MARGIN, page.y, PAGE_WIDTH - MARGIN, page.y)
+    page.y -= 8 * mm
+
+    # Société
+    c.setFillColor(BRAND_COLOR)
+    c.setFont(FONT_BOLD, 12)
+    page.y -= 4 * mm
+    c.drawString(MARGIN, page.y, "CCTS")
+    page.y -= 2 * mm
+    page.labelled_line("Adresse", values['company_street'])
+    page.labelled_line("Ville", f"{_text(values['company_city'])}, {_text(values['company_country'])}")
+    page.labelled_line("Téléphone", values['company_phone'])
+    page.labelled_line("Email", values['company_email'])
+    page.labelled_line("Site Web", "www.ccts.sn")
+    page.y -= 8 * mm
+
+    # Informations de la facture, sur fond gris
+    box_height = 5 * mm + 12 + 4 * 15 + 5 * mm
+    page.ensure_space(box_height)
+    c.setFillColor(BOX_COLOR)
+    c.roundRect(MARGIN, page.y - box_height, CONTENT_WIDTH, box_height, 5, stroke=0, fill=1)
+    page.y -= 5 * mm
+    c.setFillColor(colors.black)
+    c.setFont(FONT_BOLD, 12)
+    c.drawString(MARGIN + 4 * mm, page.y - 12, "Informations de la facture")
+    page.y -= 12
+    invoice_lines = [
+        ("Numéro de facture", values['invoice_number'], colors.black, FONT),
+        ("Date de paiement", values['date'], colors.black, FONT),
+        ("Statut", "PAYÉ", SUCCESS_COLOR, FONT_BOLD),
+        ("Mode de paiement", "Wave Money", colors.black, FONT),
+    ]
+    for label, value, color, font in invoice_lines:
+        page.y -= 15
+        c.setFont(FONT_BOLD, 10)
+        c.setFillColor(colors.black)
+        label = f"{label}: "
+        c.drawString(MARGIN + 4 * mm, page.y, label)
+        c.setFont(font, 10)
+        c.setFillColor(color)
+        c.drawString(MARGIN + 4 * mm + stringWidth(label, FONT_BOLD, 10), page.y, _text(value))
+    page.y -= 12 * mm
+
+    # Détails de la transaction
+    page.ensure_space(30)
+    c.setFillColor(colors.black)
+    c.setFont(FONT_BOLD, 12)
+    page.y -= 12
+    c.drawString(MARGIN, page.y, "Détails de la transaction")
+    page.y -= 4 * mm
+    c.setLineWidth(0.5)
+    c.setStrokeColor(BORDER_COLOR)
+    value_width = CONTENT_WIDTH - LABEL_COLUMN_WIDTH - 2 * CELL_PADDING
+    for label, value in values['details']:
+        lines = simpleSplit(_text(value), FONT, 10, value_width) or ['']
+        row_height = len(lines) * 12 + 2 * CELL_PADDING
+        page.ensure_space(row_height)
+        top = page.y
+        c.setFillColor(BRAND_COLOR)
+        c.rect(MARGIN, top - row_height, LABEL_COLUMN_WIDTH, row_height, stroke=1, fill=1)
+        c.rect(MARGIN + LABEL_COLUMN_WIDTH, top - row_height, CONTENT_WIDTH - LABEL_COLUMN_WIDTH, row_height,
+               stroke=1, fill=0)
+        c.setFillColor(colors.white)
+        c.setFont(FONT_BOLD, 10)
+        c.drawString(MARGIN + CELL_PADDING, top - CELL_PADDING - 9, label)
+        c.setFillColor(colors.black)
+        c.setFont(FONT, 10)
+        for index, line in enumerate(lines):
+            c.drawString(MARGIN + LABEL_COLUMN_WIDTH + CELL_PADDING, top - CELL_PADDING - 9 - index * 12, line)
+        page.y -= row_height
+    page.y -= 10 * mm
+
+    # Montant total, aligné à droite
+    page.ensure_space(20)
+    page.y -= 14
+    amount = _text(values['amount'])
+    c.setFont(FONT_BOLD, 14)
+    c.setFillColor(BRAND_COLOR)
+    c.drawRightString(PAGE_WIDTH - MARGIN, page.y, amount)
+    c.setFillColor(colors.black)
+    c.drawRightString(PAGE_WIDTH - MARGIN - stringWidth(amount, FONT_BOLD, 14), page.y, "MONTANT TOTAL PAYÉ: ")
+    page.y -= 15 * mm
+
+    # Pied de page
+    page.ensure_space(40)
+    center = PAGE_WIDTH / 2
+    c.setFont(FONT_BOLD, 9)
+    c.setFillColor(BRAND_COLOR)
+    page.y -= 9
+    c.drawCentredString(center, page.y, "CCTS")
+    c.setFillColor(MUTED_COLOR)
+    c.setFont(FONT, 9)
+    page.y -= 18
+    c.drawCentredString(center, page.y, "Contacts: 70 922 17 75 | 70 843 04 36")
+    page.y -= 12
+    c.drawCentredString(center, page.y, "Email: contact@ccts.sn | Web: www.ccts.sn")
+
+    c.showPage()
+    c.save()
+    return buffer.getvalue()
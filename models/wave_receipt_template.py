@@ -0,0 +1,198 @@
+"""
+Gabarit HTML des factures Wave (moteur wkhtmltopdf) et ressources statiques.
+
+Le gabarit est compilé une fois par worker et par société: CSS, logo (encodé
+en data URI) et coordonnées de la société y sont figés. Le rendu d'une facture
+ne fait plus que remplir les champs de la transaction. Le gabarit est recompilé
+quand la société est modifiée (write_date) ou quand l'empreinte du logo change.
+
+Le logo est stocké sur la configuration Wave et rafraîchi par une tâche
+planifiée (fetch_logo): aucun téléchargement n'a lieu pendant un rendu.
+"""
+import base64
+import html
+import logging
+import threading
+from string import Template
+
+import requests
+
+_logger = logging.getLogger(__name__)
+
+RECEIPT_LOGO_URL = "https://portail.toubasandaga.sn/logo.png"
+# Délai maximal du téléchargement du logo par la tâche planifiée (secondes)
+LOGO_FETCH_TIMEOUT = 10
+
+RECEIPT_CSS = """
+                body { font-family: Arial, sans-serif; margin: 0; padding: 20px; }
+                .header { text-align: center; margin-bottom: 30px; border-bottom: 2px solid #2879b9; padding-bottom: 20px; }
+                .company-section { display: flex; justify-content: space-between; align-items: flex-start; margin-bottom: 30px; }
+                .company-info { flex: 1; text-align: left; }
+                .company-logo { flex: 0 0 200px; text-align: right; }
+                .company-logo img { max-width: 180px; max-height: 120px; object-fit: contain; }
+                .invoice-info { background-color: #f8f9fa; padding: 15px; border-radius: 5px; margin-bottom: 20px; }
+                .transaction-details { margin-bottom: 20px; }
+                .table { width: 100%; border-collapse: collapse; margin-bottom: 20px; }
+                .table th, .table td { border: 1px solid #dee2e6; padding: 8px; text-align: left; }
+                .table th { background-color: #2879b9; color: white; }
+                .total { font-size: 18px; font-weight: bold; text-align: right; margin-top: 20px; }
+                .footer { margin-top: 40px; text-align: center; font-size: 12px; color: #6c757d; }
+                .status-success { color: #28a745; font-weight: bold; }
+                .ccbm-branding { color: #2879b9; font-weight: bold; }
+"""
+
+# Logos du processus: {(base, pièce jointe): (empreinte, contenu)}
+_logo_cache = {}
+_logo_lock = threading.Lock()
+
+# Gabarits compilés du processus: {(base, société): (version, gabarit)}
+_templates = {}
+_templates_lock = threading.Lock()
+
+
+def fetch_logo(url=RECEIPT_LOGO_URL, timeout=LOGO_FETCH_TIMEOUT):
+    """
+    Télécharger le logo des factures (tâche planifiée, jamais pendant un rendu).
+    Retourne None si le logo est indisponible.
+    """
+    try:
+        response = requests.get(url, timeout=timeout)
+        response.raise_for_status()
+        return response.content
+    except requests.RequestException as e:
+        _logger.warning("Logo de facture indisponible (%s): %s", url, e)
+        return None
+
+
+def get_logo(key, checksum, load):
+    """
+    Contenu du logo mis en cache par processus pour `key`, relu avec `load()`
+    seulement quand son empreinte `checksum` change.
+    """
+    if not checksum:
+        return None
+    cached = _logo_cache.get(key)
+    if cached and cached[0] == checksum:
+        return cached[1]
+    content = load()
+    with _logo_lock:
+        _logo_cache[key] = (checksum, content)
+    return content
+
+
+def _logo_img(logo):
+    """Balise image du logo en data URI; aucune image tant que le logo n'est pas enregistré"""
+    if not logo:
+        return ''
+    mimetype = 'image/jpeg' if logo[:3] == b'\xff\xd8\xff' else 'image/png'
+    src = f"data:{mimetype};base64,{base64.b64encode(logo).decode('ascii')}"
+    return f"""<img src="{src}" alt="CCTS Logo"
+                        style="max-width: 180px; max-height: 120px; object-fit: contain;" onerror="this.style.display='none'" />"""
+
+
+def _escape(value):
+    return html.escape(str(value if value not in (None, False) else ''))
+
+
+def compile_receipt_template(company_values, logo=None):
+    """
+    Compiler le gabarit de facture d'une société.
+    Les champs de la transaction restent des variables ($reference, $details...).
+    """
+    company = {key: _escape(value).replace('$', '$$') for key, value in company_values.items()}
+    css = RECEIPT_CSS.replace('$', '$$')
+    return Template(f"""
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <meta charset="utf-8"/>
+            <title>Facture Wave - $reference</title>
+            <style>{css}            </style>
+        </head>
+        <body>
+
+            <div class="header"
+                style="display: flex; justify-content: space-between; align-items: center; border-bottom: 2px solid #2879b9; padding-bottom: 20px; margin-bottom: 30px;">
+                <div style="text-align: left;">
+                    <h2 class="ccbm-branding" style="margin: 0;">FACTURE DE PAIEMENT</h2>
+                    <h3 style="margin: 5px 0 0;">Référence: $reference</h3>
+                </div>
+                <div class="company-logo" style="text-align: right;">
+                    {_logo_img(logo)}
+                </div>
+            </div>
+
+
+            <div class="company-section" style="display: flex; justify-content: space-between; align-items: center; gap: 20px;">
+                <div class="company-info">
+                    <h3 class="ccbm-branding">CCTS</h3>
+                    <p><strong>Adresse:</strong> {company['company_street']}</p>
+                    <p><strong>Ville:</strong> {company['company_city']}, {company['company_country']}</p>
+                    <p><strong>Téléphone:</strong> {company['company_phone']}</p>
+                    <p><strong>Email:</strong> {company['company_email']}</p>
+                    <p><strong>Site Web:</strong> www.ccts.sn</p>
+                </div>
+            </div>
+
+            <div class="invoice-info">
+                <h3>Informations de la facture</h3>
+                <p><strong>Numéro de facture:</strong> $invoice_number</p>
+                <p><strong>Date de paiement:</strong> $date</p>
+                <p><strong>Statut:</strong> <span class="status-success">PAYÉ</span></p>
+                <p><strong>Mode de paiement:</strong> Wave Money</p>
+            </div>
+
+            <div class="transaction-details">
+                <h3>Détails de la transaction</h3>
+                <table class="table">
+$details
+                </table>
+            </div>
+
+            <div class="total">
+                <p>MONTANT TOTAL PAYÉ: <span class="ccbm-branding">$amount</span></p>
+            </div>
+
+            <div class="footer">
+                <p><strong class="ccbm-branding">CCTS</strong> </p>
+                <p style="margin-top: 15px;">
+                    <strong>Contacts:</strong> 70 922 17 75 | 70 843 04 36<br>
+                    <strong>Email:</strong> contact@ccts.sn | <strong>Web:</strong> www.ccts.sn
+                </p>
+            </div>
+        </body>
+        </html>
+        """)
+
+
+def get_receipt_template(key, version, company_values, logo=None):
+    """
+    Gabarit compilé du processus pour `key` (base, société), recompilé si
+    `version` a changé. Une seule version est conservée par clé.
+    """
+    cached = _templates.get(key)
+    if cached and cached[0] == version:
+        return cached[1]
+    template = compile_receipt_template(company_values, logo)
+    with _templates_lock:
+        _templates[key] = (version, template)
+    return template
+
+
+def render_receipt_html(template, values):
+    """Remplir le gabarit compilé avec les valeurs de la transaction"""
+    details = ''.join(
+        f"""
+                    <tr>
+                        <th>{_escape(label)}</th>
+                        <td>{_escape(value)}</td>
+                    </tr>"""
+        for label, value in values['details']
+    )
+    return template.substitute(
+        reference=_escape(values['reference']),
+        invoice_number=_escape(values['invoice_number']),
+        date=_escape(values['date']),
+        amount=_escape(values['amount']),
+        details=details,
+    )
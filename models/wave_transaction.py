@@ -1,14 +1,79 @@
 
-from odoo import models, fields, api
+from odoo import models, fields, api, tools
 import json
-from odoo.exceptions import ValidationError
+import psycopg2
+import re
+from odoo.exceptions import ValidationError, UserError
 import logging
-import base64
 import io
-from datetime import datetime
+from collections import defaultdict
+from datetime import datetime, timedelta
+from odoo.tools import consteq
+from odoo.tools.misc import hmac as hmac_tool
+from odoo.tools.pdf import PdfFileReader, PdfFileWriter
+from odoo.tools.sql import create_index
+
+from .wave_pipeline_stage import CompletionPipeline
+from .wave_receipt_cache import receipt_cache
+from .wave_receipt_pdf import render_receipt_pdf
+from .wave_receipt_template import get_logo, get_receipt_template, render_receipt_html
 
 _logger = logging.getLogger(__name__)
 
+TERMINAL_STATUSES = ('completed', 'failed', 'cancelled', 'expired', 'refunded')
+# Canal PostgreSQL LISTEN/NOTIFY des changements de statut (charge utile: transaction_id)
+STATUS_CHANNEL = 'wave_transaction_status'
+# Nombre maximal de factures rendues par un même appel wkhtmltopdf
+RECEIPT_RENDER_BATCH_SIZE = 50
+# Au-delà, une régénération manuelle passe par la file de tâches au lieu de la requête HTTP
+RECEIPT_REGENERATE_INLINE_LIMIT = 20
+# Priorité des régénérations dans la file: après les factures des paiements complétés
+RECEIPT_REGENERATE_PRIORITY = 20
+# À incrémenter à chaque modification du gabarit de facture (invalide le cache des factures)
+RECEIPT_TEMPLATE_VERSION = 1
+
+
+def _split_pdf_by_outlines(pdf_content, count):
+    """
+    Découper un PDF en `count` documents selon ses signets de premier niveau.
+    Retourne la liste des contenus PDF, ou None si les signets ne permettent pas
+    de retrouver exactement un document par signet.
+    """
+    reader = PdfFileReader(io.BytesIO(pdf_content), strict=False)
+    root = reader.trailer['/Root']
+    if '/Outlines' not in root or '/First' not in root['/Outlines']:
+        return None
+
+    page_count = reader.getNumPages()
+    page_numbers = {reader.getPage(i).indirectRef.idnum: i for i in range(page_count)}
+    starts = []
+    node = root['/Outlines']['/First']
+    while True:
+        dest = node['/Dest']
+        if not isinstance(dest, list):
+            dest = root['/Dests'][dest]
+        page = dest[0]
+        starts.append(page if isinstance(page, int) else page_numbers[page.idnum])
+        if '/Next' not in node:
+            break
+        node = node['/Next']
+
+    starts = sorted(set(starts))
+    if len(starts) != count or starts[0] != 0:
+        return None
+
+    documents = []
+    for index, start in enumerate(starts):
+        end = starts[index + 1] if index + 1 < len(starts) else page_count
+        writer = PdfFileWriter()
+        for page_index in range(start, end):
+            writer.addPage(reader.getPage(page_index))
+        stream = io.BytesIO()
+        writer.write(stream)
+        documents.append(stream.getvalue())
+    return documents
+
+
 class WaveTransaction(models.Model):
     _name = 'wave.transaction'
     _description = 'Transaction Wave Money'
@@ -19,20 +84,17 @@ class WaveTransaction(models.Model):
     wave_id = fields.Char(
         string="ID Wave",
         required=True,
-        index=True,
         help="Identifiant unique de la transaction chez Wave"
     )
     transaction_id = fields.Char(
         string="ID de transaction",
         required=True,
-        index=True,
         help="Identifiant unique de la transaction dans Odoo"
     )
 
     reference = fields.Char(
         string="Référence",
         required=True,
-        index=True,
         help="Référence unique de la transaction côté client"
     )
     # Informations de paiement
@@ -91,13 +153,24 @@ class WaveTransaction(models.Model):
         help="URL vers le fichier PDF de la facture générée"
     )
 
+    facture_attachment_id = fields.Many2one(
+        'ir.attachment',
+        string="Pièce jointe de la facture",
+        readonly=True,
+        copy=False,
+        ondelete='set null',
+        help="Unique copie du PDF de la facture (stockée dans le filestore)"
+    )
+
     facture_pdf = fields.Binary(
         string="Facture PDF",
+        related='facture_attachment_id.datas',
         help="Fichier PDF de la facture"
     )
 
     facture_filename = fields.Char(
         string="Nom du fichier facture",
+        related='facture_attachment_id.name',
         help="Nom du fichier PDF de la facture"
     )
 
@@ -106,8 +179,26 @@ class WaveTransaction(models.Model):
         help="Date à laquelle la facture a été générée"
     )
 
+    pipeline_stage_ids = fields.One2many(
+        'wave.pipeline.stage',
+        'transaction_id',
+        string="Étapes de traitement",
+        readonly=True,
+        help="Durée, résultat et requêtes SQL de chaque étape de traitement de la transaction"
+    )
+
+    receipt_state = fields.Selection([
+        ('none', 'Aucune'),
+        ('pending', 'En cours de génération'),
+        ('ready', 'Disponible'),
+        ('failed', 'Échec de génération'),
+        ('on_demand', 'À la demande')
+    ], string='État de la facture', default='none', required=True, readonly=True,
+        help="Avancement de la génération différée de la facture PDF")
+
     facture_size = fields.Integer(
         string="Taille de la facture",
+        related='facture_attachment_id.file_size',
         help="Taille du fichier PDF de la facture en octets"
     )
 
@@ -137,6 +228,7 @@ class WaveTransaction(models.Model):
         string="Date de création",
         default=fields.Datetime.now,
         required=True,
+        index=True,
         readonly=True
     )
 
@@ -151,6 +243,12 @@ class WaveTransaction(models.Model):
         readonly=True,
         help="Date à laquelle la transaction a été complétée"
     )
+
+    status_checked_at = fields.Datetime(
+        string="Dernière vérification Wave",
+        readonly=True,
+        help="Date du dernier rafraîchissement du statut depuis l'API Wave"
+    )
     # Champs calculés
     status_color = fields.Integer(
         string="Couleur du statut",
@@ -195,197 +293,258 @@ class WaveTransaction(models.Model):
 
 
     def _generate_invoice_pdf(self):
-        """Générer la facture PDF pour la transaction"""
-        try:
-            _logger.info(f"Génération de la facture PDF pour la transaction {self.transaction_id}")
-
-            # Créer le contenu HTML de la facture
-            html_content = self._get_invoice_html_content()
-
-            # Générer le PDF à partir du HTML
-            pdf_content = self._html_to_pdf(html_content)
-
-            if pdf_content:
-                # Générer le nom du fichier
-                filename = f"facture_wave_{self.transaction_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-
-                # Encoder le PDF en base64
-                pdf_base64 = base64.b64encode(pdf_content).decode('utf-8')
-
-                # Créer un attachement
-                attachment = self.env['ir.attachment'].create({
-                    'name': filename,
-                    'type': 'binary',
-                    'datas': pdf_base64,
-                    'res_model': self._name,
-                    'res_id': self.id,
-                    'mimetype': 'application/pdf',
-                    'public': True,  # Rendre accessible publiquement
-                })
-
-                # Construire l'URL d'accès
-                base_url = self.env['ir.config_parameter'].sudo().get_param('web.base.url')
-                url_facture = f"{base_url}/web/content/{attachment.id}/{filename}"
+        """Générer la facture PDF pour la transaction (étapes mesurées)"""
+        _logger.info(f"Génération de la facture PDF pour la transaction {self.transaction_id}")
+        pipeline = CompletionPipeline(self, 'receipt')
+
+        # Générer le PDF avec le moteur configuré
+        pdf_content = pipeline.run('render', self._render_receipt_pdf, required=True)
+        url_facture = pdf_content and pipeline.run('attachment', self._store_invoice_pdf, pdf_content, required=True)
+        if url_facture:
+            self._finalize_receipt(pipeline)
+        else:
+            _logger.error(f"Erreur lors de la génération de la facture PDF de la transaction {self.transaction_id}")
+        pipeline.save()
+        return url_facture or False
 
-                # Mettre à jour les champs de la transaction
-                self.write({
-                    'facture_pdf': pdf_base64,
-                    'facture_filename': filename,
-                    'url_facture': url_facture,
-                    'facture_generated_at': fields.Datetime.now(),
-                    'facture_size': len(pdf_content)
-                })
+    def _generate_invoice_pdfs(self):
+        """
+        Générer les factures PDF de plusieurs transactions, avec un seul appel
+        wkhtmltopdf par lot de RECEIPT_RENDER_BATCH_SIZE transactions.
+        Retourne {id de transaction: URL de la facture ou False}
+        """
+        urls = {}
+        for start in range(0, len(self), RECEIPT_RENDER_BATCH_SIZE):
+            batch = self[start:start + RECEIPT_RENDER_BATCH_SIZE]
+            pipeline = CompletionPipeline(batch, 'receipt')
+            pdfs = pipeline.run('render', batch._render_receipt_pdfs, required=True) or {}
+            for transaction in batch:
+                pdf_content = pdfs.get(transaction.id)
+                if not pdf_content:
+                    _logger.error(f"Erreur lors de la génération du PDF de la transaction {transaction.transaction_id}")
+                    urls[transaction.id] = False
+                    continue
+                url_facture = pipeline.run(
+                    'attachment', transaction._store_invoice_pdf, pdf_content, transactions=transaction, required=True
+                )
+                if url_facture:
+                    transaction._finalize_receipt(pipeline)
+                urls[transaction.id] = url_facture or False
+            pipeline.save()
+        return urls
 
-                # Enregistrer automatiquement les informations
-                self._auto_save_invoice_info()
+    def _finalize_receipt(self, pipeline):
+        """
+        Étapes suivant l'enregistrement de la facture: informations et notification du
+        client. Une régénération (contexte wave_receipt_no_notify) ne notifie pas le client.
+        """
+        self.ensure_one()
+        pipeline.run('auto_save', self._auto_save_invoice_info, transactions=self)
+        if not self.env.context.get('wave_receipt_no_notify'):
+            pipeline.run('notification', self._send_invoice_notification, transactions=self)
 
-                _logger.info(f"Facture PDF générée avec succès: {url_facture}")
-                return url_facture
-            else:
-                _logger.error("Erreur lors de la génération du PDF")
-                return False
+    def _store_invoice_pdf(self, pdf_content):
+        """
+        Enregistrer le PDF de la facture dans l'unique pièce jointe de la transaction.
+        Le contenu est écrit tel quel dans le filestore (sans encodage base64). Un PDF
+        identique (même empreinte) réutilise la pièce jointe existante; sinon elle est
+        mise à jour sur place, ce qui conserve le lien déjà envoyé au client.
+        """
+        self.ensure_one()
+        # Générer le nom du fichier
+        filename = f"facture_wave_{self.transaction_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+
+        attachment = self.facture_attachment_id
+        if not attachment:
+            attachment = self.env['ir.attachment'].create({
+                'name': filename,
+                'type': 'binary',
+                'raw': pdf_content,
+                'res_model': self._name,
+                'res_id': self.id,
+                'mimetype': 'application/pdf',
+                'public': True,  # Rendre accessible publiquement
+            })
+        elif attachment.checksum != attachment._compute_checksum(pdf_content):
+            attachment.write({'name': filename, 'raw': pdf_content})
+
+        url_facture = self._get_facture_url(attachment)
+
+        # Mettre à jour la transaction en une seule écriture
+        self.write({
+            'facture_attachment_id': attachment.id,
+            'url_facture': url_facture,
+            'facture_generated_at': fields.Datetime.now(),
+            'auto_saved': True,
+        })
+
+        _logger.info(f"Facture PDF générée avec succès: {url_facture}")
+        return url_facture
+
+    def _get_facture_url(self, attachment):
+        """URL publique d'accès à la pièce jointe de la facture"""
+        base_url = self.env['ir.config_parameter'].sudo().get_param('web.base.url')
+        return f"{base_url}/web/content/{attachment.id}/{attachment.name}"
+
+    def _get_receipt_access_token(self):
+        """Jeton d'accès public à la facture (signé avec le secret de la base)"""
+        self.ensure_one()
+        return hmac_tool(self.env(su=True), 'wave-receipt', self.id)
+
+    def _check_receipt_access_token(self, token):
+        return bool(token) and consteq(token, self._get_receipt_access_token())
+
+    def _get_receipt_public_url(self):
+        """Lien public de la facture, rendue à la première consultation si nécessaire"""
+        self.ensure_one()
+        base_url = self.env['ir.config_parameter'].sudo().get_param('web.base.url')
+        return f"{base_url}/wave/receipt/{self.id}/{self._get_receipt_access_token()}"
+
+    def _get_receipt_template_version(self):
+        """Version du gabarit de facture: change avec le code du gabarit, le moteur, la société ou le logo"""
+        company = self.env.company
+        logo_checksum = self.env['wave.config'].sudo()._get_active_config()._get_receipt_logo_attachment().checksum
+        return (
+            f"{RECEIPT_TEMPLATE_VERSION}-{self._get_receipt_engine()}-{company.id}-"
+            f"{company.write_date}-{company.partner_id.write_date}-{logo_checksum or ''}"
+        )
 
+    def _get_receipt_pdf(self):
+        """
+        Contenu PDF de la facture: celui de la pièce jointe si elle a été générée,
+        sinon un rendu à la demande conservé dans le cache LRU du processus.
+        """
+        self.ensure_one()
+        if self.facture_attachment_id:
+            return self.facture_attachment_id.raw
+
+        key = (self.env.cr.dbname, self.id, self.write_date, self._get_receipt_template_version())
+        pdf_content = receipt_cache.get(key)
+        if pdf_content is None:
+            _logger.info(f"Rendu à la demande de la facture de la transaction {self.transaction_id}")
+            pdf_content = self._render_receipt_pdf()
+            if pdf_content:
+                config = self.env['wave.config'].sudo()._get_active_config()
+                if config:
+                    receipt_cache.resize(config.receipt_cache_size * 1024 * 1024)
+                receipt_cache.put(key, pdf_content)
+        return pdf_content
+
+    def _get_receipt_filename(self):
+        self.ensure_one()
+        return self.facture_filename or f"facture_wave_{self.transaction_id}.pdf"
+
+    def _prepare_on_demand_receipt(self):
+        """Mode à la demande: publier le lien de la facture sans la rendre"""
+        for transaction in self:
+            transaction.write({
+                'url_facture': transaction._get_receipt_public_url(),
+                'receipt_state': 'on_demand',
+            })
+        return True
+
+    def _get_receipt_engine(self):
+        config = self.env['wave.config'].sudo()._get_active_config()
+        return config.receipt_engine if config else 'wkhtmltopdf'
+
+    def _render_receipt_pdf(self):
+        """Rendre la facture PDF de la transaction avec le moteur configuré"""
+        self.ensure_one()
+        if self._get_receipt_engine() == 'native':
+            return self._render_receipt_pdf_native()
+        return self._html_to_pdf(self._get_invoice_html_content())
+
+    def _render_receipt_pdf_native(self):
+        """Dessiner la facture directement en PDF (reportlab), sans wkhtmltopdf"""
+        self.ensure_one()
+        try:
+            return render_receipt_pdf(
+                dict(self._get_receipt_company_values(), **self._get_receipt_values()), self._get_receipt_logo()[0]
+            )
         except Exception as e:
-            _logger.error(f"Erreur lors de la génération de la facture PDF: {str(e)}")
+            _logger.error(f"Erreur lors du rendu natif de la facture {self.transaction_id}: {str(e)}")
             return False
 
-    def _get_invoice_html_content(self):
-        """Générer le contenu HTML de la facture avec le logo CCBM"""
-        # Récupérer les informations de l'entreprise
-        company = self.env.company
-
-        # Formatage de la date
-        date_facture = self.completed_at.strftime('%d/%m/%Y %H:%M:%S') if self.completed_at else datetime.now().strftime('%d/%m/%Y %H:%M:%S')
-
-        html_content = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="utf-8"/>
-            <title>Facture Wave - {self.reference}</title>
-            <style>
-                body {{ font-family: Arial, sans-serif; margin: 0; padding: 20px; }}
-                .header {{ text-align: center; margin-bottom: 30px; border-bottom: 2px solid #2879b9; padding-bottom: 20px; }}
-                .company-section {{ display: flex; justify-content: space-between; align-items: flex-start; margin-bottom: 30px; }}
-                .company-info {{ flex: 1; text-align: left; }}
-                .company-logo {{ flex: 0 0 200px; text-align: right; }}
-                .company-logo img {{ max-width: 180px; max-height: 120px; object-fit: contain; }}
-                .invoice-info {{ background-color: #f8f9fa; padding: 15px; border-radius: 5px; margin-bottom: 20px; }}
-                .transaction-details {{ margin-bottom: 20px; }}
-                .table {{ width: 100%; border-collapse: collapse; margin-bottom: 20px; }}
-                .table th, .table td {{ border: 1px solid #dee2e6; padding: 8px; text-align: left; }}
-                .table th {{ background-color: #2879b9; color: white; }}
-                .total {{ font-size: 18px; font-weight: bold; text-align: right; margin-top: 20px; }}
-                .footer {{ margin-top: 40px; text-align: center; font-size: 12px; color: #6c757d; }}
-                .status-success {{ color: #28a745; font-weight: bold; }}
-                .ccbm-branding {{ color: #2879b9; font-weight: bold; }}
-            </style>
-        </head>
-        <body>
-
-            <div class="header"
-                style="display: flex; justify-content: space-between; align-items: center; border-bottom: 2px solid #2879b9; padding-bottom: 20px; margin-bottom: 30px;">
-                <div style="text-align: left;">
-                    <h2 class="ccbm-branding" style="margin: 0;">FACTURE DE PAIEMENT</h2>
-                    <h3 style="margin: 5px 0 0;">Référence: {self.reference}</h3>
-                </div>
-                <div class="company-logo" style="text-align: right;">
-                    <img src="https://portail.toubasandaga.sn/logo.png" alt="CCTS Logo"
-                        style="max-width: 180px; max-height: 120px; object-fit: contain;" onerror="this.style.display='none'" />
-                </div>
-            </div>
-
-            
-            <div class="company-section" style="display: flex; justify-content: space-between; align-items: center; gap: 20px;">
-                <div class="company-info">
-                    <h3 class="ccbm-branding">CCTS</h3>
-                    <p><strong>Adresse:</strong> {company.street or 'Dakar, Sénégal'}</p>
-                    <p><strong>Ville:</strong> {company.city or 'Dakar'}, {company.country_id.name or 'Sénégal'}</p>
-                    <p><strong>Téléphone:</strong> {company.phone or '70 922 17 75 | 70 843 04 36'}</p>
-                    <p><strong>Email:</strong> {company.email or 'shop@ccbm.sn'}</p>
-                    <p><strong>Site Web:</strong> www.ccts.sn</p>
-                </div>
-            </div>
-
-            <div class="invoice-info">
-                <h3>Informations de la facture</h3>
-                <p><strong>Numéro de facture:</strong> WAVE-{self.id:06d}</p>
-                <p><strong>Date de paiement:</strong> {date_facture}</p>
-                <p><strong>Statut:</strong> <span class="status-success">PAYÉ</span></p>
-                <p><strong>Mode de paiement:</strong> Wave Money</p>
-            </div>
-
-            <div class="transaction-details">
-                <h3>Détails de la transaction</h3>
-                <table class="table">
-                    <tr>
-                        <th>Transaction ID</th>
-                        <td>{self.transaction_id}</td>
-                    </tr>
-                    <tr>
-                        <th>Wave ID</th>
-                        <td>{self.wave_id}</td>
-                    </tr>
-                    <tr>
-                        <th>Téléphone</th>
-                        <td>{self.phone or 'N/A'}</td>
-                    </tr>
-                    <tr>
-                        <th>Description</th>
-                        <td>{self.description or 'Paiement via Wave Money'}</td>
-                    </tr>
+    def _render_receipt_pdfs(self):
+        """
+        Rendre les factures PDF de plusieurs transactions avec le moteur configuré
+        (un seul appel wkhtmltopdf pour tout le lot).
+        Retourne {id de transaction: contenu PDF ou False}
         """
+        if self._get_receipt_engine() == 'native':
+            return {transaction.id: transaction._render_receipt_pdf_native() for transaction in self}
+        return self._html_to_pdf_batch()
 
-        # Ajouter les détails de la commande si elle existe
-        if self.account_move_id:
-            html_content += f"""
-                    <tr>
-                        <th>Commande liée</th>
-                        <td>{self.account_move_id.name}</td>
-                    </tr>
-            """
+    def _get_receipt_company_values(self):
+        """Coordonnées de la société affichées sur la facture"""
+        company = self.env.company
+        return {
+            'company_street': company.street or 'Dakar, Sénégal',
+            'company_city': company.city or 'Dakar',
+            'company_country': company.country_id.name or 'Sénégal',
+            'company_phone': company.phone or '70 922 17 75 | 70 843 04 36',
+            'company_email': company.email or 'shop@ccbm.sn',
+        }
 
-        # Ajouter les détails du client si il existe
+    def _get_receipt_values(self):
+        """Valeurs de la transaction affichées sur la facture, communes aux moteurs de rendu"""
+        self.ensure_one()
+        details = [
+            ('Transaction ID', self.transaction_id),
+            ('Wave ID', self.wave_id),
+            ('Téléphone', self.phone or 'N/A'),
+            ('Description', self.description or 'Paiement via Wave Money'),
+        ]
+        if self.account_move_id:
+            details.append(('Commande liée', self.account_move_id.name))
         if self.partner_id:
-            html_content += f"""
-                    <tr>
-                        <th>Client</th>
-                        <td>{self.partner_id.name}</td>
-                    </tr>
-                    <tr>
-                        <th>Email Client</th>
-                        <td>{self.partner_id.email or 'N/A'}</td>
-                    </tr>
-            """
+            details += [
+                ('Client', self.partner_id.name),
+                ('Email Client', self.partner_id.email or 'N/A'),
+            ]
+        completed_at = self.completed_at or datetime.now()
+        return {
+            'reference': self.reference,
+            'invoice_number': f"WAVE-{self.id:06d}",
+            'date': completed_at.strftime('%d/%m/%Y %H:%M:%S'),
+            'details': details,
+            'amount': self.formatted_amount,
+        }
 
-        html_content += f"""
-                </table>
-            </div>
-
-            <div class="total">
-                <p>MONTANT TOTAL PAYÉ: <span class="ccbm-branding">{self.formatted_amount}</span></p>
-            </div>
-
-            <div class="footer">
-                <p><strong class="ccbm-branding">CCTS</strong> </p>
-                <p style="margin-top: 15px;">
-                    <strong>Contacts:</strong> 70 922 17 75 | 70 843 04 36<br>
-                    <strong>Email:</strong> contact@ccts.sn | <strong>Web:</strong> www.ccts.sn
-                </p>
-            </div>
-        </body>
-        </html>
+    @api.model
+    def _get_receipt_logo(self):
         """
+        Logo des factures enregistré sur la configuration active et son empreinte.
+        Le contenu n'est relu depuis le filestore que lorsque l'empreinte change.
+        """
+        attachment = self.env['wave.config'].sudo()._get_active_config()._get_receipt_logo_attachment()
+        if not attachment:
+            return None, False
+        logo = get_logo((self.env.cr.dbname, attachment.id), attachment.checksum, lambda: attachment.raw)
+        return logo, attachment.checksum
+
+    def _get_receipt_template(self):
+        """Gabarit HTML compilé de la société courante, mis en cache par worker"""
+        company = self.env.company
+        logo, logo_checksum = self._get_receipt_logo()
+        version = (
+            RECEIPT_TEMPLATE_VERSION, company.write_date, company.partner_id.write_date, logo_checksum
+        )
+        return get_receipt_template(
+            (self.env.cr.dbname, company.id), version, self._get_receipt_company_values(), logo
+        )
 
-        return html_content
-    
+    def _get_invoice_html_content(self):
+        """Générer le contenu HTML de la facture avec le logo CCBM (gabarit compilé)"""
+        self.ensure_one()
+        return render_receipt_html(self._get_receipt_template(), self._get_receipt_values())
 
     def _html_to_pdf(self, html_content):
-        """Convertir le HTML en PDF"""
+        """Convertir le HTML en PDF (un document ou une liste de documents)"""
         try:
             # Utiliser wkhtmltopdf via Odoo
             return self.env['ir.actions.report']._run_wkhtmltopdf(
-                [html_content],
+                html_content if isinstance(html_content, list) else [html_content],
                 landscape=False,
                 specific_paperformat_args={
                     'data-report-margin-top': 10,
@@ -399,138 +558,251 @@ class WaveTransaction(models.Model):
             _logger.error(f"Erreur lors de la conversion HTML vers PDF: {str(e)}")
             return False
 
+    def _html_to_pdf_batch(self):
+        """
+        Rendre les factures des transactions en un seul appel wkhtmltopdf, puis
+        découper le document obtenu par transaction grâce à ses signets (chaque
+        facture commence par un titre h2). Si le découpage n'est pas fiable, les
+        factures sont rendues une à une.
+        Retourne {id de transaction: contenu PDF ou False}
+        """
+        if len(self) == 1:
+            return {self.id: self._html_to_pdf(self._get_invoice_html_content())}
+
+        pdf_content = self._html_to_pdf([transaction._get_invoice_html_content() for transaction in self])
+        documents = None
+        if pdf_content:
+            try:
+                documents = _split_pdf_by_outlines(pdf_content, len(self))
+            except Exception as e:
+                _logger.warning(f"Découpage du PDF groupé impossible: {str(e)}")
+        if documents:
+            return dict(zip(self.ids, documents))
+
+        _logger.warning(f"Rendu groupé de {len(self)} factures non découpable, rendu une à une")
+        return {
+            transaction.id: transaction._html_to_pdf(transaction._get_invoice_html_content())
+            for transaction in self
+        }
+
     def _auto_save_invoice_info(self):
         """Enregistrer automatiquement les informations après génération de la facture"""
-        try:
-            _logger.info(f"Enregistrement automatique des informations pour la transaction {self.transaction_id}")
-
-            # Créer un enregistrement dans un modèle de log ou historique
-            invoice_log_data = {
-                'transaction_id': self.transaction_id,
-                'wave_id': self.wave_id,
-                'reference': self.reference,
-                'amount': self.amount,
-                'currency': self.currency,
-                'phone': self.phone,
-                'partner_name': self.partner_id.name if self.partner_id else 'N/A',
-                'account_move_name': self.account_move_id.name if self.account_move_id else 'N/A',
-                'facture_url': self.url_facture,
-                'facture_filename': self.facture_filename,
-                'facture_size': self.facture_size,
-                'generated_at': self.facture_generated_at,
-                'status': 'completed'
-            }
+        _logger.info(f"Enregistrement automatique des informations pour la transaction {self.transaction_id}")
+
+        # Créer un enregistrement dans un modèle de log ou historique
+        invoice_log_data = {
+            'transaction_id': self.transaction_id,
+            'wave_id': self.wave_id,
+            'reference': self.reference,
+            'amount': self.amount,
+            'currency': self.currency,
+            'phone': self.phone,
+            'partner_name': self.partner_id.name if self.partner_id else 'N/A',
+            'account_move_name': self.account_move_id.name if self.account_move_id else 'N/A',
+            'facture_url': self.url_facture,
+            'facture_filename': self.facture_filename,
+            'facture_size': self.facture_size,
+            'generated_at': self.facture_generated_at,
+            'status': 'completed'
+        }
 
-            # Enregistrer dans les logs système
-            _logger.info(f"Facture générée et enregistrée: {json.dumps(invoice_log_data, default=str)}")
+        # Enregistrer dans les logs système
+        _logger.info(f"Facture générée et enregistrée: {json.dumps(invoice_log_data, default=str)}")
 
-            # Marquer comme enregistré automatiquement
+        # Marquer comme enregistré automatiquement
+        if not self.auto_saved:
             self.write({'auto_saved': True})
 
-            # Optionnel: Envoyer une notification ou email
-            self._send_invoice_notification()
-
-            return True
-
-        except Exception as e:
-            _logger.error(f"Erreur lors de l'enregistrement automatique: {str(e)}")
-            return False
+        return True
 
     def _send_invoice_notification(self):
         """Envoyer une notification après génération de la facture"""
-        try:
-            if self.partner_id and self.partner_id.email:
-                # Créer le message email
-                body_html = f"""
-                    <p>Bonjour {self.partner_id.name},</p>
-                    <p>Votre paiement Wave a été traité avec succès.</p>
-                    <p><strong>Détails:</strong></p>
-                    <ul>
-                        <li>Transaction ID: {self.transaction_id}</li>
-                        <li>Montant: {self.formatted_amount}</li>
-                        <li>Date: {self.completed_at.strftime('%d/%m/%Y %H:%M:%S') if self.completed_at else 'N/A'}</li>
-                    </ul>
-                    <p>Vous pouvez télécharger votre facture <a href="{self.url_facture}">ici</a>.</p>
-                    <p>Merci pour votre confiance,<br>L'équipe CCTS</p>
-                """
-
-                sujet = f'Facture Wave - {self.reference}'
-                # Envoyer l'email
-                mail_server = self.env['ir.mail_server'].sudo().search([], limit=1)        
-                email_from = mail_server.smtp_user
-                if not email_from:
-                    email_from = 'ccbmtech@ccbm.sn'
- 
-                additional_email = 'alhussein.khouma@ccbm.sn'
-                email_to = f'{self.partner_id.email}, {additional_email}'
-
-                email_values = {
-                    'email_from': email_from,
-                    'email_to': email_to,
-                    'subject': sujet,
-                    'body_html': body_html,
-                    'state': 'outgoing',
-                }
-                mail_mail = self.env['mail.mail'].sudo().create(email_values)
-                try:
-                    mail_mail.send()
-                    return True
-                except Exception as e:
-                    return False
-            return False 
+        if self.partner_id and self.partner_id.email:
+            # Créer le message email
+            body_html = f"""
+                <p>Bonjour {self.partner_id.name},</p>
+                <p>Votre paiement Wave a été traité avec succès.</p>
+                <p><strong>Détails:</strong></p>
+                <ul>
+                    <li>Transaction ID: {self.transaction_id}</li>
+                    <li>Montant: {self.formatted_amount}</li>
+                    <li>Date: {self.completed_at.strftime('%d/%m/%Y %H:%M:%S') if self.completed_at else 'N/A'}</li>
+                </ul>
+                <p>Vous pouvez télécharger votre facture <a href="{self.url_facture}">ici</a>.</p>
+                <p>Merci pour votre confiance,<br>L'équipe CCTS</p>
+            """
 
-        except Exception as e:
-            _logger.error(f"Erreur lors de l'envoi de la notification: {str(e)}")
+            sujet = f'Facture Wave - {self.reference}'
+            email_from = self._get_invoice_email_from()
 
+            additional_email = 'alhussein.khouma@ccbm.sn'
+            email_to = f'{self.partner_id.email}, {additional_email}'
+
+            email_values = {
+                'email_from': email_from,
+                'email_to': email_to,
+                'subject': sujet,
+                'body_html': body_html,
+                'state': 'outgoing',
+            }
+            # Mettre l'email en file: la tâche planifiée du module mail l'envoie par lots,
+            # sur une connexion SMTP réutilisée, hors du traitement du paiement
+            self.env['mail.mail'].sudo().create(email_values)
+            self.env.ref('mail.ir_cron_mail_scheduler_action').sudo()._trigger()
+            return True
+        return False
+
+    @api.model
+    @tools.ormcache()
+    def _get_invoice_email_from(self):
+        """Expéditeur des notifications de facture (cache vidé à la modification des serveurs de mail)"""
+        mail_server = self.env['ir.mail_server'].sudo().search([], limit=1)
+        return mail_server.smtp_user or 'ccbmtech@ccbm.sn'
+
+
+    def _notify_status_change(self, new_status):
+        """Réveiller les attentes longues sur le statut (NOTIFY délivré à la validation SQL)"""
+        for record in self.filtered(lambda t: t.status != new_status):
+            self.env.cr.execute("SELECT pg_notify(%s, %s)", (STATUS_CHANNEL, record.transaction_id))
 
     def write(self, vals):
         """Surcharger write pour mettre à jour la date de modification et générer la facture"""
         if 'status' in vals:
             _logger.info(f"Changing status of transaction {self.id} from {self.status} to {vals['status']}")
+            self._notify_status_change(vals['status'])
         vals['updated_at'] = fields.Datetime.now()
         # Si le statut passe à 'completed', enregistrer la date et générer la facture
         if vals.get('status') == 'completed' and self.status != 'completed':
             vals['completed_at'] = fields.Datetime.now()
             # Appeler la méthode de génération de facture après la mise à jour
             result = super().write(vals)
-            # Générer la facture PDF de manière asynchrone pour éviter les blocages
-            try:
-                self._generate_invoice_pdf()
-                _logger.info(f"Facture générée avec succès pour la transaction {self.transaction_id}")
-            except Exception as e:
-                _logger.error(f"Erreur lors de la génération de la facture pour la transaction {self.transaction_id}: {str(e)}")
-            # Créer le paiement et le relier à la facture
-            try:
-                self._create_payment_and_link_invoice()
-                _logger.info(f"Paiement créé et réconcilié avec succès pour la transaction {self.transaction_id} au niveau de write")
-            except Exception as e:
-                _logger.error(f"Erreur lors de la création du paiement pour la transaction {self.transaction_id}: {str(e)}")
+            # Étapes de complétion, mesurées (wave.pipeline.stage)
+            pipeline = CompletionPipeline(self, 'completion')
+            config = self.env['wave.config'].sudo()._get_active_config()
+            if config.receipt_mode == 'lazy':
+                # La facture sera rendue à la première consultation du lien
+                if pipeline.run('receipt_link', self._prepare_on_demand_receipt):
+                    for transaction in self:
+                        pipeline.run('notification', transaction._send_invoice_notification, transactions=transaction)
+            else:
+                # Planifier la génération de la facture PDF (file de tâches) pour éviter les blocages
+                pipeline.run('receipt_schedule', self.env['wave.receipt.job'].sudo()._enqueue, self)
+            # Créer le paiement et le relier à la facture (sauf s'il est enregistré par l'appelant)
+            if not self.env.context.get('wave_skip_payment'):
+                pipeline.run('payment', lambda: self._register_payments() or False)
+            pipeline.save()
             return result
         return super().write(vals)
 
 
+    def _claim_status_refresh(self, ttl):
+        """
+        Réserver le rafraîchissement du statut depuis Wave.
+        Retourne False pour un statut terminal, un statut vérifié il y a moins de
+        `ttl` secondes, ou une transaction déjà en cours de rafraîchissement par une
+        autre requête (SKIP LOCKED): l'appelant sert alors le statut en base.
+        Args:
+            ttl: Durée de validité du statut en attente (secondes)
+        Returns:
+            bool: True si l'appelant doit interroger Wave
+        """
+        self.ensure_one()
+        if self.status in TERMINAL_STATUSES:
+            return False
+        now = fields.Datetime.now()
+        try:
+            with self.env.cr.savepoint(flush=False):
+                self.env.cr.execute("""
+                    SELECT id FROM wave_transaction
+                     WHERE id = %s
+                       AND status NOT IN %s
+                       AND (status_checked_at IS NULL OR status_checked_at < %s)
+                       FOR UPDATE SKIP LOCKED
+                """, (self.id, TERMINAL_STATUSES, now - timedelta(seconds=ttl)))
+                claimed = self.env.cr.fetchone()
+        except psycopg2.errors.SerializationFailure:
+            # La ligne vient d'être mise à jour par une requête concurrente
+            return False
+        if not claimed:
+            return False
+        self.env.cr.execute("UPDATE wave_transaction SET status_checked_at = %s WHERE id = %s", (now, self.id))
+        self.invalidate_recordset(['status_checked_at'])
+        return True
+
+    def _get_initiate_values(self):
+        """Valeurs d'une transaction existante renvoyées par l'initiation de paiement"""
+        self.ensure_one()
+        return {
+            'transaction_id': self.transaction_id,
+            'wave_id': self.wave_id,
+            'payment_url': self.payment_link_url,
+            'status': self.status or 'pending',
+            'account_move_id': self.account_move_id.id,
+            'partner_id': self.partner_id.id,
+            'reference': self.reference,
+        }
+
     @api.model
-    def create(self, vals):
-        """Surcharger create pour ajouter des validations"""
-        # Vérifier l'unicité du transaction_id
-        if vals.get('transaction_id'):
-            existing = self.search([('transaction_id', '=', vals['transaction_id'])])
-            if existing:
-                raise ValidationError(f"Une transaction avec l'ID '{vals['transaction_id']}' existe déjà.")
+    def _lock_initiate(self, transaction_id):
+        """
+        Sérialiser l'initiation d'un paiement pour un transaction_id.
+        Le verrou consultatif est tenu jusqu'à la fin de la transaction SQL: un appel
+        concurrent attend que le premier ait créé et validé sa transaction Wave, puis
+        reçoit son résultat sans rappeler l'API Wave.
+        Args:
+            transaction_id: ID de transaction Odoo
+        Returns:
+            dict: valeurs de la transaction existante (_get_initiate_values), ou None
+        """
+        existing = self.search([('transaction_id', '=', transaction_id)], limit=1)
+        if existing:
+            return existing._get_initiate_values()
 
-        # Vérifier l'unicité de la référence
-        if vals.get('reference'):
-            existing = self.search([('reference', '=', vals['reference'])])
-            if existing:
-                raise ValidationError(f"Une transaction avec la référence '{vals['reference']}' existe déjà.")
+        self.env.cr.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (f"wave.initiate:{transaction_id}",))
 
-        return super().create(vals)
+        # Le snapshot du curseur courant peut précéder le commit de l'appel qui
+        # détenait le verrou: relire dans un nouveau curseur
+        with self.env.registry.cursor() as cr:
+            existing = self.with_env(self.env(cr=cr)).search([('transaction_id', '=', transaction_id)], limit=1)
+            return existing._get_initiate_values() if existing else None
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        """
+        Créer les transactions en un seul lot.
+        L'unicité de transaction_id et de la référence est garantie par les
+        index uniques; une violation est traduite en ValidationError.
+        """
+        try:
+            with self.env.cr.savepoint(flush=False):
+                return super().create(vals_list)
+        except psycopg2.errors.UniqueViolation as e:
+            raise ValidationError(self._get_unique_violation_message(e)) from None
+
+    @api.model
+    def _get_unique_violation_message(self, error):
+        """Message d'erreur d'une violation d'unicité (valeur extraite du détail PostgreSQL)"""
+        constraint = error.diag.constraint_name or ''
+        match = re.match(r'Key \((\w+)\)=\((.*)\) already exists', error.diag.message_detail or '')
+        value = match.group(2) if match else None
+        if constraint == f'{self._table}_transaction_id_unique':
+            if value is not None:
+                return f"Une transaction avec l'ID '{value}' existe déjà."
+            return "L'ID de transaction doit être unique."
+        if constraint == f'{self._table}_reference_unique':
+            if value is not None:
+                return f"Une transaction avec la référence '{value}' existe déjà."
+            return "La référence doit être unique."
+        if constraint == f'{self._table}_wave_id_unique':
+            if value is not None:
+                return f"Une transaction avec l'ID Wave '{value}' existe déjà."
+            return "L'ID Wave doit être unique."
+        return f"Transaction Wave en double: {error.diag.message_detail or error}"
 
     def action_refresh_status(self):
         """Action pour rafraîchir le statut depuis Wave"""
         try:
-            config = self.env['wave.config'].search([('is_active', '=', True)], limit=1)
+            config = self.env['wave.config']._get_active_config()
             if not config:
                 raise ValidationError("Aucune configuration Wave active trouvée.")
             # Utiliser la méthode du modèle pour récupérer la session
@@ -597,12 +869,19 @@ class WaveTransaction(models.Model):
 
     def action_download_invoice(self):
         """Action pour télécharger la facture PDF"""
-        if self.facture_pdf:
+        if self.facture_attachment_id:
             return {
                 'type': 'ir.actions.act_url',
                 'url': f'/web/content?model={self._name}&id={self.id}&field=facture_pdf&filename_field=facture_filename&download=true',
                 'target': 'self',
             }
+        elif self.status == 'completed':
+            # Facture non encore générée: rendu à la demande
+            return {
+                'type': 'ir.actions.act_url',
+                'url': f'/wave/receipt/{self.id}/{self._get_receipt_access_token()}?download=1',
+                'target': 'self',
+            }
         else:
             return {
                 'type': 'ir.actions.client',
@@ -622,6 +901,12 @@ class WaveTransaction(models.Model):
                 'url': self.url_facture,
                 'target': 'new',
             }
+        elif self.status == 'completed':
+            return {
+                'type': 'ir.actions.act_url',
+                'url': self._get_receipt_public_url(),
+                'target': 'new',
+            }
         else:
             return {
                 'type': 'ir.actions.client',
@@ -634,51 +919,93 @@ class WaveTransaction(models.Model):
             }
 
     def action_regenerate_invoice(self):
-        """Action pour régénérer la facture manuellement"""
-        if self.status == 'completed':
-            try:
-                url_facture = self._generate_invoice_pdf()
-                if url_facture:
-                    return {
-                        'type': 'ir.actions.client',
-                        'tag': 'display_notification',
-                        'params': {
-                            'title': 'Facture régénérée',
-                            'message': f'La facture a été régénérée avec succès: {url_facture}',
-                            'type': 'success',
-                        }
-                    }
-                else:
-                    return {
-                        'type': 'ir.actions.client',
-                        'tag': 'display_notification',
-                        'params': {
-                            'title': 'Erreur',
-                            'message': 'Erreur lors de la régénération de la facture.',
-                            'type': 'danger',
-                        }
-                    }
-            except Exception as e:
+        """Action pour régénérer la facture manuellement (une ou plusieurs transactions)"""
+        completed = self.filtered(lambda t: t.status == 'completed')
+        if not completed:
+            return {
+                'type': 'ir.actions.client',
+                'tag': 'display_notification',
+                'params': {
+                    'title': 'Transaction non complétée',
+                    'message': 'La facture ne peut être générée que pour les transactions complétées.',
+                    'type': 'warning',
+                }
+            }
+
+        if len(completed) > RECEIPT_REGENERATE_INLINE_LIMIT:
+            # Trop de factures pour une requête HTTP: régénération par la file de tâches
+            self.env['wave.receipt.job'].sudo()._enqueue(
+                completed, priority=RECEIPT_REGENERATE_PRIORITY, notify=False
+            )
+            message = f'{len(completed)} facture(s) planifiée(s) pour régénération'
+            skipped = len(self) - len(completed)
+            if skipped:
+                message += f', {skipped} transaction(s) non complétée(s) ignorée(s)'
+            return {
+                'type': 'ir.actions.client',
+                'tag': 'display_notification',
+                'params': {
+                    'title': 'Régénération des factures',
+                    'message': message,
+                    'type': 'info',
+                }
+            }
+
+        try:
+            # Régénération: le client a déjà reçu sa facture, ne pas la renvoyer
+            urls = completed.with_context(wave_receipt_no_notify=True)._generate_invoice_pdfs()
+        except Exception as e:
+            return {
+                'type': 'ir.actions.client',
+                'tag': 'display_notification',
+                'params': {
+                    'title': 'Erreur',
+                    'message': f'Erreur lors de la régénération: {str(e)}',
+                    'type': 'danger',
+                }
+            }
+
+        regenerated = completed.filtered(lambda t: urls.get(t.id))
+        regenerated.write({'receipt_state': 'ready'})
+
+        if len(self) == 1:
+            if regenerated:
                 return {
                     'type': 'ir.actions.client',
                     'tag': 'display_notification',
                     'params': {
-                        'title': 'Erreur',
-                        'message': f'Erreur lors de la régénération: {str(e)}',
-                        'type': 'danger',
+                        'title': 'Facture régénérée',
+                        'message': f'La facture a été régénérée avec succès: {urls[self.id]}',
+                        'type': 'success',
                     }
                 }
-        else:
             return {
                 'type': 'ir.actions.client',
                 'tag': 'display_notification',
                 'params': {
-                    'title': 'Transaction non complétée',
-                    'message': 'La facture ne peut être générée que pour les transactions complétées.',
-                    'type': 'warning',
+                    'title': 'Erreur',
+                    'message': 'Erreur lors de la régénération de la facture.',
+                    'type': 'danger',
                 }
             }
 
+        failed = len(completed) - len(regenerated)
+        skipped = len(self) - len(completed)
+        message = f'{len(regenerated)} facture(s) régénérée(s)'
+        if failed:
+            message += f', {failed} en erreur'
+        if skipped:
+            message += f', {skipped} transaction(s) non complétée(s) ignorée(s)'
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': 'Régénération des factures',
+                'message': message,
+                'type': 'warning' if failed else 'success',
+            }
+        }
+
     # Autres méthodes existantes...
     def action_view_payment_link(self):
         """Action pour ouvrir le lien de paiement"""
@@ -722,115 +1049,150 @@ class WaveTransaction(models.Model):
             }
 
     def _create_payment_and_link_invoice(self):
-        """Créer un paiement et le relier à la facture existante pour une transaction réussie"""
+        """Créer les paiements et les relier aux factures existantes pour des transactions réussies"""
         try:
-            _logger.info(f"Création du paiement pour la transaction {self.transaction_id}")
-
-            # Vérifier que la transaction est bien complétée
-            if self.status != 'completed':
-                _logger.warning(f"La transaction {self.transaction_id} n'est pas complétée. Aucun paiement créé.")
-                return False
-
-            # Vérifier qu'une facture est liée
-            if not self.account_move_id:
-                _logger.error(f"Aucune facture liée à la transaction {self.transaction_id}.")
-                return False
-
-            # Vérifier qu'un client est lié
-            if not self.partner_id:
-                _logger.error(f"Aucun client lié à la transaction {self.transaction_id}.")
-                return False
-
-            # Récupérer les informations nécessaires
-            account_move = self.account_move_id
-            partner = self.partner_id
-            company = self.env.company
-
-            # Rechercher un journal de type 'bank' ou 'cash'
-            journal = self.env['account.journal'].search([
-                ('type', 'in', ['bank', 'cash']),
-                ('company_id', '=', company.id)
-            ], limit=1)
-
-            if not journal:
-                _logger.error("Aucun journal de paiement (bank/cash) trouvé pour la compagnie.")
-                return False
-
-            # Rechercher une méthode de paiement
-            payment_method = self.env['account.payment.method'].search([
-                ('payment_type', '=', 'inbound')
-            ], limit=1)
-
-            if not payment_method:
-                _logger.error("Aucune méthode de paiement trouvée.")
-                return False
+            _logger.info(f"Création du paiement pour les transactions {', '.join(self.mapped('transaction_id'))}")
+            payments = self._register_payments()
+            return bool(payments)
+        except Exception as e:
+            _logger.error(f"Erreur lors de la création du paiement: {str(e)}")
+            return False
 
-            # Créer le paiement
-            payment = self.env['account.payment'].create({
+    def _register_payments(self):
+        """
+        Enregistrer en une fois les paiements de transactions complétées: création
+        groupée des paiements, une seule validation, puis réconciliation des lignes
+        clients regroupée par facture et partenaire.
+        Lève une UserError si aucun journal ou méthode de paiement n'est disponible.
+        Returns:
+            account.payment: paiements créés
+        """
+        transactions = self.filtered(lambda t: t.status == 'completed' and t.account_move_id)
+        for transaction in self - transactions:
+            _logger.warning(f"La transaction {transaction.transaction_id} n'est pas complétée ou n'a pas de facture liée. Aucun paiement créé.")
+        if not transactions:
+            return self.env['account.payment']
+
+        payment_method = self._get_payment_method()
+        if not payment_method:
+            raise UserError("Aucune méthode de paiement entrante trouvée.")
+
+        journals = {}
+        vals_list = []
+        for transaction in transactions:
+            invoice = transaction.account_move_id
+            company = invoice.company_id
+            if company not in journals:
+                journals[company] = self._get_payment_journal(company)
+            if not journals[company]:
+                raise UserError(f"Aucun journal de paiement (bank/cash) trouvé pour la société {company.name}.")
+            vals_list.append({
                 'payment_type': 'inbound',
                 'partner_type': 'customer',
-                'partner_id': partner.id,
-                'amount': self.amount,
-                'journal_id': journal.id,
-                'currency_id': account_move.currency_id.id,
+                'partner_id': (transaction.partner_id or invoice.partner_id).id,
+                'amount': transaction.amount,
+                'journal_id': journals[company].id,
+                'currency_id': invoice.currency_id.id,
                 'payment_method_id': payment_method.id,
-                'ref': f"Paiement Wave - {self.reference}",
-                # 'move_id': account_move.id,  # Lier directement à la facture existante
+                'ref': f"Paiement Wave - {transaction.reference or invoice.name}",
             })
 
-            # Valider le paiement
-            payment.action_post()
+        # Créer et valider tous les paiements en une fois
+        payments = self.env['account.payment'].create(vals_list)
+        payments.action_post()
 
-            # Réconcilier automatiquement le paiement avec la facture
-            self._reconcile_payment_with_invoice(payment, account_move)
+        # Réconcilier par facture et partenaire
+        groups = defaultdict(lambda: self.env['account.payment'])
+        for transaction, payment in zip(transactions, payments):
+            groups[(transaction.account_move_id, payment.partner_id.commercial_partner_id)] |= payment
+        for (invoice, _partner), invoice_payments in groups.items():
+            self._reconcile_payment_with_invoice(invoice_payments, invoice)
 
-            _logger.info(f"Paiement créé et réconcilié avec succès pour la transaction {self.transaction_id}")
-            return True
-        except Exception as e:
-            _logger.error(f"Erreur lors de la création du paiement: {str(e)}")
-            return False
+        _logger.info(f"{len(payments)} paiement(s) Wave créé(s) et réconcilié(s)")
+        return payments
+
+    @api.model
+    def _get_payment_journal(self, company):
+        """Journal des paiements Wave d'une société: celui de la configuration, sinon la recherche mise en cache"""
+        config = self.env['wave.config'].sudo()._get_active_config()
+        if config.payment_journal_id and config.payment_journal_id.company_id == company:
+            return config.payment_journal_id
+        return self.env['account.journal'].sudo().browse(self._get_default_payment_journal_id(company.id))
+
+    @api.model
+    @tools.ormcache('company_id')
+    def _get_default_payment_journal_id(self, company_id):
+        """Journal 'CSH1' de la société, sinon son premier journal de caisse ou de banque (cache vidé à la modification des journaux)"""
+        journal = self.env['account.journal'].sudo().search([
+            ('code', '=', 'CSH1'),
+            ('company_id', '=', company_id)
+        ], limit=1)
+        if not journal:
+            journal = self.env['account.journal'].sudo().search([
+                ('type', 'in', ['cash', 'bank']),
+                ('company_id', '=', company_id)
+            ], limit=1)
+        return journal.id
 
+    @api.model
+    def _get_payment_method(self):
+        """Méthode de paiement entrante des paiements Wave: celle de la configuration, sinon la recherche mise en cache"""
+        config = self.env['wave.config'].sudo()._get_active_config()
+        if config.payment_method_id:
+            return config.payment_method_id
+        return self.env['account.payment.method'].sudo().browse(self._get_default_payment_method_id())
 
+    @api.model
+    @tools.ormcache()
+    def _get_default_payment_method_id(self):
+        return self.env['account.payment.method'].sudo().search([('payment_type', '=', 'inbound')], limit=1).id
 
-    def _reconcile_payment_with_invoice(self, payment, invoice):
+    def _reconcile_payment_with_invoice(self, payments, invoice):
         """
-        Réconcilie le paiement avec la facture
+        Réconcilie les paiements avec la facture
         Args:
-            payment: Objet account.payment
+            payments: Objets account.payment
             invoice: Objet account.move
         """
         try:
-            invoice_lines = invoice.line_ids.filtered(
-                lambda line: line.account_id.account_type == 'asset_receivable' and not line.reconciled
-            )
-            if not invoice_lines:
+            with self.env.cr.savepoint():
                 invoice_lines = invoice.line_ids.filtered(
-                    lambda line: line.account_id.internal_type == 'receivable' and not line.reconciled
+                    lambda line: line.account_id.account_type == 'asset_receivable' and not line.reconciled
                 )
-            payment_lines = payment.move_id.line_ids.filtered(
-                lambda line: line.account_id.account_type == 'asset_receivable'
-            )
-            if not payment_lines:
-                payment_lines = payment.move_id.line_ids.filtered(
-                    lambda line: line.account_id.internal_type == 'receivable'
+                payment_lines = payments.move_id.line_ids.filtered(
+                    lambda line: line.account_id.account_type == 'asset_receivable' and not line.reconciled
                 )
-            lines_to_reconcile = invoice_lines + payment_lines
-            if lines_to_reconcile:
-                lines_to_reconcile.reconcile()
-                _logger.info(f"Paiement {payment.name} réconcilié avec la facture {invoice.name}")
-            else:
-                _logger.warning(f"Aucune ligne à réconcilier trouvée pour le paiement {payment.name} et la facture {invoice.name}")
+                if invoice_lines and payment_lines:
+                    (invoice_lines + payment_lines).reconcile()
+                    _logger.info(f"Paiements {', '.join(payments.mapped('name'))} réconciliés avec la facture {invoice.name}")
+                else:
+                    _logger.warning(f"Aucune ligne à réconcilier trouvée pour les paiements {', '.join(payments.mapped('name'))} et la facture {invoice.name}")
         except Exception as e:
             _logger.error(f"Erreur lors de la réconciliation du paiement: {str(e)}")
 
-
-
-
     _sql_constraints = [
         ('transaction_id_unique', 'UNIQUE(transaction_id)', 'L\'ID de transaction doit être unique.'),
         ('reference_unique', 'UNIQUE(reference)', 'La référence doit être unique.'),
+        ('wave_id_unique', 'UNIQUE(wave_id)', 'L\'ID Wave doit être unique.'),
     ]
 
+    def init(self):
+        """
+        Index des chemins d'accès fréquents (les index uniques servent les recherches
+        par wave_id, transaction_id et référence):
+            - statistiques de facture: account_move_id et statut
+            - filtres par statut sur une période, regroupements: statut et date
+              (created_at seul, pour l'ordre par défaut et les filtres « Aujourd'hui » /
+              « Cette semaine », est indexé par le champ)
+            - transactions en attente (balayages): index partiel sur la date
+        """
+        create_index(self._cr, 'wave_transaction_account_move_status_index',
+                     self._table, ['account_move_id', 'status'])
+        create_index(self._cr, 'wave_transaction_status_created_at_index',
+                     self._table, ['status', 'created_at DESC'])
+        create_index(self._cr, 'wave_transaction_pending_created_at_index',
+                     self._table, ['created_at'], where="status = 'pending'")
+
 
     
 
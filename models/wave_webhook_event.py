@@ -0,0 +1,364 @@
+from odoo import models, fields, api
+import json
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from .wave_pipeline_stage import CompletionPipeline
+
+_logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+DEFAULT_BATCH_SIZE = 100
+
+
+class WaveWebhookEvent(models.Model):
+    _name = 'wave.webhook.event'
+    _description = 'Événement webhook Wave'
+    _order = 'id desc'
+    _rec_name = 'event_type'
+
+    event_key = fields.Char(
+        string="Clé d'événement",
+        required=True,
+        readonly=True,
+        help="Identifiant de l'événement Wave (ou type et session à défaut), unique: "
+             "les renvois d'un même événement sont ignorés"
+    )
+
+    event_type = fields.Char(
+        string="Type d'événement",
+        index=True,
+        help="Type de l'événement Wave (ex: checkout.session.completed)"
+    )
+
+    session_id = fields.Char(
+        string="ID de session Wave",
+        index=True,
+        help="Identifiant de la session de paiement concernée"
+    )
+
+    payload = fields.Text(
+        string="Données reçues",
+        required=True,
+        help="Corps brut du webhook tel que reçu"
+    )
+
+    state = fields.Selection([
+        ('pending', 'En attente'),
+        ('done', 'Traité'),
+        ('ignored', 'Ignoré'),
+        ('duplicate', 'Doublon'),
+        ('error', 'Erreur')
+    ], string='État', default='pending', required=True, index=True)
+
+    attempts = fields.Integer(
+        string="Tentatives",
+        default=0,
+        help="Nombre de tentatives de traitement"
+    )
+
+    next_attempt_at = fields.Datetime(
+        string="Prochaine tentative",
+        help="Date à partir de laquelle un événement en échec peut être retraité"
+    )
+
+    error = fields.Text(
+        string="Erreur",
+        help="Dernière erreur rencontrée lors du traitement"
+    )
+
+    transaction_id = fields.Many2one(
+        'wave.transaction',
+        string="Transaction",
+        help="Transaction Wave concernée par l'événement"
+    )
+
+    received_at = fields.Datetime(
+        string="Date de réception",
+        default=fields.Datetime.now,
+        required=True,
+        readonly=True
+    )
+
+    processed_at = fields.Datetime(
+        string="Date de traitement",
+        readonly=True
+    )
+
+    _sql_constraints = [
+        ('event_key_unique', 'UNIQUE(event_key)', "Cet événement Wave a déjà été reçu."),
+    ]
+
+    @api.model
+    def _get_event_key(self, webhook_data):
+        """Clé de déduplication: ID de l'événement Wave, sinon type et ID de session"""
+        if webhook_data.get('id'):
+            return str(webhook_data['id'])
+        session = webhook_data.get('data') or {}
+        session_id = session.get('id') if isinstance(session, dict) else None
+        return f"{webhook_data.get('type') or webhook_data.get('event')}:{session_id}"
+
+    @api.model
+    def _enqueue(self, webhook_data, body):
+        """
+        Enregistrer un webhook reçu dans la boîte de réception et planifier son traitement.
+        Un événement déjà reçu est écarté par l'index unique sur event_key, sans
+        autre requête ni traitement.
+        Args:
+            webhook_data: Données JSON décodées
+            body: Corps brut de la requête (str)
+        Returns:
+            wave.webhook.event: événement créé, vide si c'est un renvoi
+        """
+        session = webhook_data.get('data') or {}
+        now = fields.Datetime.now()
+        self.env.cr.execute("""
+            INSERT INTO wave_webhook_event
+                (event_key, event_type, session_id, payload, state, attempts, received_at,
+                 create_uid, create_date, write_uid, write_date)
+            VALUES (%s, %s, %s, %s, 'pending', 0, %s, %s, %s, %s, %s)
+            ON CONFLICT (event_key) DO NOTHING
+            RETURNING id
+        """, (
+            self._get_event_key(webhook_data),
+            webhook_data.get('type') or webhook_data.get('event'),
+            session.get('id') if isinstance(session, dict) else None,
+            body,
+            now, self.env.uid, now, self.env.uid, now,
+        ))
+        row = self.env.cr.fetchone()
+        if not row:
+            _logger.info("Webhook Wave déjà reçu, ignoré: %s", self._get_event_key(webhook_data))
+            return self.browse()
+        self.env.ref(f'{self._module}.ir_cron_process_wave_webhook_events')._trigger()
+        return self.browse(row[0])
+
+    @api.model
+    def _cron_process_pending(self, max_batches=10):
+        """Traiter les webhooks en attente par lots (tâche planifiée)"""
+        config = self.env['wave.config'].sudo()._get_active_config()
+        batch_size = config.webhook_batch_size if config else DEFAULT_BATCH_SIZE
+        for _i in range(max_batches):
+            events = self._claim_batch(batch_size)
+            if not events:
+                return True
+            events._process()
+            # Une validation par lot et non par événement
+            self.env.cr.commit()
+        # Il reste des événements: replanifier immédiatement
+        self.env.ref(f'{self._module}.ir_cron_process_wave_webhook_events')._trigger()
+        return True
+
+    @api.model
+    def _purge_history(self, cutoff):
+        """Supprimer les événements terminés reçus avant `cutoff` (les événements en attente sont conservés)"""
+        self.env.cr.execute("""
+            DELETE FROM wave_webhook_event
+             WHERE state != 'pending'
+               AND received_at < %s
+        """, (cutoff,))
+        return self.env.cr.rowcount
+
+    @api.model
+    def _claim_batch(self, batch_size):
+        """Réserver un lot d'événements en attente (ignorés par les autres workers jusqu'au commit)"""
+        self.env.cr.execute("""
+            SELECT id FROM wave_webhook_event
+             WHERE state = 'pending'
+               AND (next_attempt_at IS NULL OR next_attempt_at <= %s)
+             ORDER BY id
+             LIMIT %s
+               FOR UPDATE SKIP LOCKED
+        """, (fields.Datetime.now(), batch_size))
+        return self.browse([row[0] for row in self.env.cr.fetchall()])
+
+    def _process(self):
+        """
+        Traiter un lot d'événements.
+        Chaque événement met à jour sa transaction dans son propre savepoint; les
+        paiements des transactions complétées sont ensuite enregistrés et réconciliés
+        en une fois, ou facture par facture si le traitement groupé échoue.
+        Returns:
+            dict: {event_id: résultat}
+        """
+        results = {}
+        now = fields.Datetime.now()
+
+        # Une même session déjà traitée avec succès par un autre événement: ne rien refaire
+        duplicates = self._find_duplicates()
+        for event in duplicates:
+            results[event.id] = {'success': True, 'duplicate': True}
+
+        # Mise à jour des transactions, sans enregistrer les paiements au fil de l'eau
+        completed = defaultdict(lambda: self.browse())
+        for event in self - duplicates:
+            try:
+                with self.env.cr.savepoint():
+                    result = event.with_context(wave_skip_payment=True)._process_wave_webhook(
+                        json.loads(event.payload)
+                    )
+            except Exception as e:
+                _logger.exception("Erreur lors du traitement du webhook %s", event.id)
+                result = {'success': False, 'error': str(e)}
+            results[event.id] = result
+            if result.get('success') and result.get('payment_required'):
+                completed[event.transaction_id.account_move_id] |= event
+
+        # Paiements de toutes les transactions complétées du lot en une fois
+        if completed:
+            transactions = self.env['wave.transaction'].sudo()
+            for events in completed.values():
+                transactions |= events.mapped('transaction_id')
+            pipeline = CompletionPipeline(transactions, 'webhook')
+            payments = pipeline.run('payment', transactions._register_payments, required=True)
+            pipeline.save()
+            if payments:
+                completed = {}
+            else:
+                _logger.warning("Paiement groupé impossible, reprise facture par facture")
+
+        # Reprise facture par facture pour isoler la facture en erreur
+        for invoice, events in completed.items():
+            result = self.process_payment(invoice, events.mapped('transaction_id'))
+            if not result['success']:
+                # Le statut est déjà enregistré: un nouvel essai ne referait pas le paiement,
+                # l'échec est donc définitif et visible dans la boîte de réception
+                for event in events:
+                    results[event.id] = dict(result, final=True)
+
+        # Enregistrer l'issue de chaque événement, une écriture par groupe de valeurs
+        grouped = defaultdict(lambda: self.browse())
+        for event in self:
+            result = results[event.id]
+            attempts = event.attempts + (0 if result.get('duplicate') else 1)
+            if result.get('duplicate'):
+                state = 'duplicate'
+            elif result.get('success'):
+                state = 'done'
+            elif result.get('error') == 'Unhandled event':
+                state = 'ignored'
+            else:
+                state = 'error' if attempts >= MAX_ATTEMPTS or result.get('final') else 'pending'
+            # Nouvel essai après un délai croissant (2, 4, 8... minutes), pas dans le lot suivant
+            next_attempt_at = now + timedelta(minutes=2 ** attempts) if state == 'pending' else False
+            grouped[(state, attempts, result.get('error') or False, next_attempt_at)] |= event
+        for (state, attempts, error, next_attempt_at), events in grouped.items():
+            events.write({
+                'state': state,
+                'attempts': attempts,
+                'error': error,
+                'next_attempt_at': next_attempt_at,
+                'processed_at': now,
+            })
+        return results
+
+    def _find_duplicates(self):
+        """Événements dont la session a déjà été traitée avec succès par un autre événement"""
+        sessions = [event.session_id for event in self if event.session_id]
+        if not sessions:
+            return self.browse()
+        done = self.search([
+            ('session_id', 'in', sessions),
+            ('state', '=', 'done'),
+            ('id', 'not in', self.ids),
+        ])
+        done_keys = {(event.session_id, event.event_type) for event in done}
+        duplicates = self.browse()
+        seen = set()
+        for event in self.sorted('id'):
+            key = (event.session_id, event.event_type)
+            if event.session_id and (key in done_keys or key in seen):
+                duplicates |= event
+            seen.add(key)
+        return duplicates
+
+    def _process_wave_webhook(self, webhook_data):
+        """
+        Appliquer un événement à sa transaction.
+        Returns:
+            dict: résultat; 'payment_required' indique une transaction complétée
+                  dont le paiement reste à enregistrer
+        """
+        self.ensure_one()
+        event_type = webhook_data.get('type') or webhook_data.get('event')
+        _logger.info(f"Processing Wave event: {event_type}")
+
+        if event_type != "checkout.session.completed":
+            return {'success': False, 'error': 'Unhandled event'}
+
+        session = webhook_data.get('data', {})
+        session_id = session.get('id')
+        if not session_id:
+            return {'success': False, 'error': 'Missing session ID'}
+
+        transaction = self.env['wave.transaction'].sudo().search([('wave_id', '=', session_id)], limit=1)
+        if not transaction:
+            return {'success': False, 'error': 'Transaction not found'}
+        self.transaction_id = transaction
+
+        checkout_status = session.get('checkout_status', '').lower()
+        payment_status = session.get('payment_status', '').lower()
+        new_status = self._map_wave_status_to_odoo(checkout_status, payment_status)
+        previous_status = transaction.status
+
+        transaction.write({
+            'status': new_status,
+            'updated_at': fields.Datetime.now(),
+            'completed_at': self.convert_iso_format_to_custom_format(session.get('when_completed')),
+            'webhook_data': json.dumps(webhook_data),
+            'checkout_status': checkout_status,
+            'payment_status': payment_status,
+        })
+
+        if new_status == 'completed':
+            if not transaction.account_move_id:
+                return {'success': False, 'error': 'No linked invoice found'}
+            # Le paiement n'est enregistré qu'au passage à l'état complété
+            return {'success': True, 'payment_required': previous_status != 'completed'}
+
+        return {'success': True}
+
+    def _map_wave_status_to_odoo(self, checkout_status, payment_status):
+        status_map = {
+            ('complete', 'succeeded'): 'completed',
+            ('failed', 'any'): 'failed',
+            ('any', 'failed'): 'failed',
+            ('cancelled', 'any'): 'cancelled',
+            ('any', 'cancelled'): 'cancelled',
+            ('expired', 'any'): 'expired',
+        }
+        return status_map.get((checkout_status, payment_status), 'pending')
+
+    def convert_iso_format_to_custom_format(self, iso_date):
+        try:
+            return datetime.strptime(iso_date, "%Y-%m-%dT%H:%M:%SZ").strftime("%Y-%m-%d %H:%M:%S")
+        except Exception:
+            return None
+
+    def process_payment(self, invoice, transactions):
+        """
+        Enregistre les paiements de plusieurs transactions sur une même facture
+        et les réconcilie ensemble.
+        Args:
+            invoice: Facture existante (account.move)
+            transactions: Transactions Wave complétées de cette facture
+        Returns:
+            dict: Résultat du traitement
+        """
+        try:
+            with self.env.cr.savepoint():
+                payments = transactions.sudo()._register_payments()
+            if not payments:
+                return {'success': False, 'error': 'Erreur lors de l\'enregistrement du paiement'}
+
+            return {
+                'success': True,
+                'payment_ids': payments.ids,
+                'invoice_id': invoice.id,
+                'amount': sum(transactions.mapped('amount')),
+                'message': 'Paiement enregistré et réconcilié avec succès'
+            }
+        except Exception as e:
+            _logger.error(f"Erreur lors du traitement du paiement: {str(e)}")
+            return {'success': False, 'error': str(e)}